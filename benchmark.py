@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import timeit
+
+import numpy as np
+from cms50dplus import test_package, CMS50Dplus, RealtimeDataPoint
+
+
+# reference decoders with separate mask and shift operations
+
+def decode_package(packets):
+    package = packets[2:]
+    for idx, byte in enumerate(package):
+        package[idx] = CMS50Dplus.set_bit(byte, packets[1] & 0x01 << idx)
+    return packets[0], package
+
+
+def set_package(datapoint, package):
+    datapoint.signal_strength = package[0] & 0x0f
+    datapoint.searching_too_long = (package[0] & 0x10) >> 4
+    datapoint.low_spO2 = (package[0] & 0x20) >> 5
+    datapoint.pulse_beep = (package[0] & 0x40) >> 6
+    datapoint.probe_error = (package[0] & 0x80) >> 7
+    datapoint.pulse_waveform = package[1] & 0x7f
+    datapoint.searching_pulse = (package[1] & 0x80) >> 7
+    datapoint.bar_graph = package[2] & 0x0f
+    datapoint.pi_valid = (package[2] & 0x10) >> 4
+    datapoint.reserved = (package[2] & 0xe0) >> 5
+    datapoint.pulse_rate = package[3]
+    datapoint.pulse_rate_invalid = int(datapoint.pulse_rate == 0xff)
+    datapoint.spO2 = package[4]
+    datapoint.spO2_invalid = int(datapoint.spO2 == 0x7f)
+    datapoint.pi = package[6] << 8 | package[5]
+    datapoint.pi_invalid = int(datapoint.pi == 0xffff)
+
+
+def decode_packages(packets):
+    high_bytes = packets[:, 1:2]
+    package = packets[:, 2:]
+    shifts = np.arange(package.shape[1], dtype=np.uint8)
+    return packets[:, 0], (package & 0x7f) | ((high_bytes >> shifts) & 1) << 7
+
+
+# lookup table decoders
+
+def decode_package_table(packets):
+    high_bits = CMS50Dplus.high_bits[packets[1] & 0x7f]
+    return packets[0], [
+        byte & 0x7f | bit for byte, bit in zip(packets[2:], high_bits)]
+
+
+def decode_packages_table(packets):
+    high_bits = CMS50Dplus.high_bits_array.take(packets[:, 1] & 0x7f, axis=0)
+    return packets[:, 0], (packets[:, 2:] & 0x7f) | high_bits
+
+
+def benchmark(name, reference, function, count, number=10):
+    reference_time = min(timeit.repeat(reference, number=number, repeat=5))
+    function_time = min(timeit.repeat(function, number=number, repeat=5))
+    print("{:<20} {:>10.3f} us {:>10.3f} us {:>8.2f}x".format(
+        name, reference_time / number / count * 10**6,
+        function_time / number / count * 10**6,
+        reference_time / function_time))
+
+
+if __name__ == "__main__":
+    count = 10000
+    packets_list = [
+        CMS50Dplus.encode_package(0x01, test_package(7))
+        for idx in range(0, count)]
+    packages = [decode_package(packets)[1] for packets in packets_list]
+    packets_array = np.array(packets_list, dtype=np.uint8)
+    datapoint = RealtimeDataPoint(0x01, packages[0])
+
+    print("{:<20} {:>13} {:>13} {:>9}".format(
+        "per package", "mask/shift", "table", "speedup"))
+    benchmark(
+        "high byte",
+        lambda: [decode_package(packets) for packets in packets_list],
+        lambda: [decode_package_table(packets) for packets in packets_list],
+        count)
+    benchmark(
+        "bit fields",
+        lambda: [set_package(datapoint, package) for package in packages],
+        lambda: [
+            datapoint.set_package(0x01, package, False)
+            for package in packages],
+        count)
+    benchmark(
+        "high byte (numpy)",
+        lambda: decode_packages(packets_array),
+        lambda: decode_packages_table(packets_array),
+        count)
@@ -1,11 +1,28 @@
 #!/usr/bin/env python
+import os
+import io
 import sys
+import re
 import datetime
 import time
 import random
+import functools
+import hashlib
+import struct
+import json
+import zlib
+import lzma
+import asyncio
 import csv
+import queue
 import argparse
 import threading
+import concurrent.futures
+import selectors
+import select
+import itertools
+import heapq
+import collections
 import tkinter
 from tkinter import messagebox, simpledialog, filedialog
 
@@ -45,10 +62,51 @@ def test_realtime():
         yield RealtimeDataPoint(1, test_package(7))
 
 
+class SessionClock():
+    # monotonic nanoseconds, anchored to the wall clock once per session
+    def __init__(self):
+        self.anchor = time.time_ns()  # nanoseconds since the epoch
+        self.monotonic_anchor = time.monotonic_ns()
+        self.anchor_datetime = self.to_datetime(self.anchor)
+
+    @staticmethod
+    def to_nanoseconds(timestamp):
+        if isinstance(timestamp, datetime.datetime):
+            return (int(timestamp.replace(microsecond=0).timestamp())
+                    * 10**9 + timestamp.microsecond * 1000)
+        return int(timestamp)
+
+    @staticmethod
+    def to_datetime(nanoseconds):
+        return datetime.datetime.fromtimestamp(
+            nanoseconds // 10**9).replace(
+                microsecond=nanoseconds % 10**9 // 1000)
+
+    @staticmethod
+    def now():
+        return time.monotonic_ns()
+
+    def get_epoch_nanoseconds(self, timestamp):
+        return self.anchor + timestamp - self.monotonic_anchor
+
+    def get_datetime(self, timestamp):
+        return self.anchor_datetime + datetime.timedelta(
+            microseconds=(timestamp - self.monotonic_anchor) // 1000)
+
+    def get_datetimes(self, timestamps):
+        # converts an array of timestamps to datetime64
+        offsets = (np.asarray(timestamps, dtype=np.int64)
+                   - self.monotonic_anchor) // 1000
+        return (np.datetime64(self.anchor_datetime, 'us')
+                + offsets.astype('timedelta64[us]'))
+
+
 class DataPoint():
+    __slots__ = ('time', 'package_type')  # no instance dict per sample
     datatype = ''
     specs = {}  # {package_type: package_length, ...}
     attributes = []  # [(attribute, string, csvheader), ...]
+    dtype = np.dtype([])  # record type for batch decoding
 
     def __init__(self, package_type, package, time=False):
         self.time = time and time or datetime.datetime.now()
@@ -84,11 +142,17 @@ class DataPoint():
     def get_csv_header(cls):
         return [attr[2] for attr in cls.attributes]
 
-    def get_csv_data(self):
-        return [getattr(self, attr[0]) for attr in self.attributes]
+    def get_csv_data(self, clock=None):
+        # clock: SessionClock of datapoints stamped with monotonic time
+        data = [getattr(self, attr[0]) for attr in self.attributes]
+        if clock is not None:
+            data[0] = clock.get_datetime(self.time)  # time
+        return data
 
     def set_csv_data(self, data):
         for attr, _, key in self.attributes:
+            if attr == 'datatype':  # class constant
+                continue
             if key in data:
                 value = data[key]
                 if isinstance(value, float):
@@ -97,12 +161,55 @@ class DataPoint():
                     value = dateparser.parse(value)
                 setattr(self, attr, value)
 
+    def get_record(self):
+        return tuple(getattr(self, name) for name in self.dtype.names)
+
+    def set_record(self, record):
+        for name, value in zip(self.dtype.names, record):
+            setattr(self, name, value)
+
+    @classmethod
+    def get_columns(cls, datapoints, clock=None):
+        # clock: SessionClock of datapoints stamped with monotonic time
+        records = np.array(
+            [datapoint.get_record() for datapoint in datapoints],
+            dtype=cls.dtype)
+        columns = {name: records[name] for name in cls.dtype.names}
+        columns['time'] = cls.get_time_column(datapoints, clock)
+        return columns
+
+    @staticmethod
+    def get_time_column(datapoints, clock=None):
+        times = [datapoint.time for datapoint in datapoints]
+        if clock is not None:
+            return clock.get_datetimes(times)
+        return np.array(times, dtype='datetime64[us]')
+
+    @classmethod
+    def from_record(cls, record, time):
+        datapoint = cls.__new__(cls)
+        datapoint.time = time
+        datapoint.set_record(record)
+        return datapoint
+
     def get_dict_data(self):
         ret = dict()
         for n, d in zip(self.get_csv_header(), self.get_csv_data()):
             ret[n] = d
         return ret
 
+    @classmethod
+    def check_packages(cls, package_types, packages):
+        if not np.isin(package_types, list(cls.specs)).all():
+            raise ValueError("Invalid package type.")
+        for package_type in np.unique(package_types):
+            if packages.shape[1] != cls.specs[package_type]:
+                raise ValueError("Invalid package length.")
+
+    @classmethod
+    def decode_packages(cls, package_types, packages):
+        raise NotImplementedError('decode_packages() not implemented.')
+
     def set_package(package_type, package, time):
         raise NotImplementedError('set_package() not implemented.')
 
@@ -111,7 +218,13 @@ class DataPoint():
 
 
 class RealtimeDataPoint(DataPoint):
+    __slots__ = (
+        'spO2', 'pulse_rate', 'pulse_waveform', 'pulse_beep', 'bar_graph',
+        'pi', 'signal_strength', 'probe_error', 'low_spO2',
+        'searching_too_long', 'searching_pulse', 'spO2_invalid',
+        'pulse_rate_invalid', 'pi_valid', 'pi_invalid', 'reserved')
     datatype = 'realtime'
+    sample_seconds = 1 / 60  # nominal time between datapoints
     specs = {  # {package_type: package_length, ...}
         0x01: 7
     }
@@ -136,23 +249,89 @@ class RealtimeDataPoint(DataPoint):
         ('datatype',           "Data Type = {}",          "DataType"),
         ('package_type',       "Package Type = {}",       "PackageType"),
     ]
+    dtype = np.dtype([  # record type for batch decoding
+        ('spO2',               np.uint8),
+        ('pulse_rate',         np.uint8),
+        ('pulse_waveform',     np.uint8),
+        ('pulse_beep',         np.uint8),
+        ('bar_graph',          np.uint8),
+        ('pi',                 np.uint16),
+        ('signal_strength',    np.uint8),
+        ('probe_error',        np.uint8),
+        ('low_spO2',           np.uint8),
+        ('searching_too_long', np.uint8),
+        ('searching_pulse',    np.uint8),
+        ('spO2_invalid',       np.uint8),
+        ('pulse_rate_invalid', np.uint8),
+        ('pi_valid',           np.uint8),
+        ('pi_invalid',         np.uint8),
+        ('reserved',           np.uint8),
+        ('package_type',       np.uint8),
+    ])
+    bit_fields = [  # [[(attribute, mask, shift), ...], ...] per package byte
+        [  # packet byte 2 / package byte 0
+            ('signal_strength',    0x0f, 0),
+            ('searching_too_long', 0x10, 4),
+            ('low_spO2',           0x20, 5),
+            ('pulse_beep',         0x40, 6),
+            ('probe_error',        0x80, 7),
+        ],
+        [  # packet byte 3 / package byte 1
+            ('pulse_waveform',     0x7f, 0),
+            ('searching_pulse',    0x80, 7),
+        ],
+        [  # packet byte 4 / package byte 2
+            ('bar_graph',          0x0f, 0),
+            ('pi_valid',           0x10, 4),
+            ('reserved',           0xe0, 5),
+        ],
+    ]
+    bit_tables = []  # [[(value, ...) for each byte], ...] built on import
+
+    @classmethod
+    def decode_packages(cls, package_types, packages):
+        cls.check_packages(package_types, packages)
+        records = np.zeros(len(packages), dtype=cls.dtype)
+        records['package_type'] = package_types
+
+        # packet byte 2-4 / package byte 0-2, masks are faster than tables
+        for idx, fields in enumerate(cls.bit_fields):
+            for name, mask, shift in fields:
+                records[name] = (packages[:, idx] & mask) >> shift
+
+        # packet byte 5 / package byte 3
+        records['pulse_rate'] = packages[:, 3]
+        records['pulse_rate_invalid'] = packages[:, 3] == 0xff
+
+        # packet byte 6 / package byte 4
+        records['spO2'] = packages[:, 4]
+        records['spO2_invalid'] = packages[:, 4] == 0x7f
+
+        # packet byte 7-8 / package byte 5-6
+        records['pi'] = packages[:, 6].astype(np.uint16) << 8 | packages[:, 5]
+        records['pi_invalid'] = records['pi'] == 0xffff
+
+        return records
+
+    @classmethod
+    def build_bit_tables(cls):
+        cls.bit_tables = [
+            [tuple((byte & mask) >> shift for name, mask, shift in fields)
+             for byte in range(0, 256)]
+            for fields in cls.bit_fields]
 
     def set_package(self, package_type, package, time):
         # packet byte 2 / package byte 0
-        self.signal_strength = package[0] & 0x0f
-        self.searching_too_long = (package[0] & 0x10) >> 4
-        self.low_spO2 = (package[0] & 0x20) >> 5
-        self.pulse_beep = (package[0] & 0x40) >> 6
-        self.probe_error = (package[0] & 0x80) >> 7
+        (self.signal_strength, self.searching_too_long, self.low_spO2,
+         self.pulse_beep, self.probe_error) = self.bit_tables[0][package[0]]
 
         # packet byte 3 / package byte 1
-        self.pulse_waveform = package[1] & 0x7f
-        self.searching_pulse = (package[1] & 0x80) >> 7
+        (self.pulse_waveform,
+         self.searching_pulse) = self.bit_tables[1][package[1]]
 
         # packet byte 4 / package byte 2
-        self.bar_graph = package[2] & 0x0f
-        self.pi_valid = (package[2] & 0x10) >> 4
-        self.reserved = (package[2] & 0xe0) >> 5
+        (self.bar_graph, self.pi_valid,
+         self.reserved) = self.bit_tables[2][package[2]]
 
         # packet byte 5 / package byte 3
         self.pulse_rate = package[3]
@@ -204,8 +383,102 @@ class RealtimeDataPoint(DataPoint):
         return package
 
 
+RealtimeDataPoint.build_bit_tables()
+
+
+class LazyRealtimeDataPoint(RealtimeDataPoint):
+    # keeps the package and decodes attributes on access. once attributes
+    # are changed, the package is decoded into the slots and dropped.
+    __slots__ = ('package',)
+    decoders = {  # {attribute: function(package), ...}
+        # packet byte 2-4 / package byte 0-2: bit fields added on import
+
+        # packet byte 5 / package byte 3
+        'pulse_rate':         lambda package: package[3],
+        'pulse_rate_invalid': lambda package: int(package[3] == 0xff),
+
+        # packet byte 6 / package byte 4
+        'spO2':               lambda package: package[4],
+        'spO2_invalid':       lambda package: int(package[4] == 0x7f),
+
+        # packet byte 7-8 / package byte 5-6
+        'pi':                 lambda package: package[6] << 8 | package[5],
+        'pi_invalid':         lambda package: int(
+            package[6] == 0xff and package[5] == 0xff),
+    }
+
+    @classmethod
+    def get_columns(cls, datapoints, clock=None):
+        # decodes the kept packages at once
+        if any(getattr(dp, 'package', None) is None for dp in datapoints):
+            return super().get_columns(datapoints, clock)
+        packages = np.frombuffer(
+            b''.join(dp.package for dp in datapoints), dtype=np.uint8)
+        records = cls.decode_packages(
+            np.array([dp.package_type for dp in datapoints], dtype=np.uint8),
+            packages.reshape(-1, cls.specs[0x01]))
+        columns = {name: records[name] for name in cls.dtype.names}
+        columns['time'] = cls.get_time_column(datapoints, clock)
+        return columns
+
+    @staticmethod
+    def get_bit_decoder(idx, mask, shift):
+        return lambda package: (package[idx] & mask) >> shift
+
+    @classmethod
+    def add_fields(cls):
+        # decoders of the bit fields follow RealtimeDataPoint.bit_fields
+        for idx, fields in enumerate(cls.bit_fields):
+            for name, mask, shift in fields:
+                cls.decoders[name] = cls.get_bit_decoder(idx, mask, shift)
+        for name, decode in cls.decoders.items():
+            setattr(cls, name, cls.get_field(name, decode))
+
+    @staticmethod
+    def get_field(name, decode):
+        # decodes from the package while it is kept, reads the slot after
+        slot = RealtimeDataPoint.__dict__[name]
+
+        def get(datapoint):
+            if datapoint.package is None:
+                return slot.__get__(datapoint)
+            return decode(datapoint.package)
+
+        def set(datapoint, value):
+            if datapoint.package is not None:
+                datapoint.decode()
+            slot.__set__(datapoint, value)
+
+        return property(get, set)
+
+    def set_package(self, package_type, package, time):
+        self.package = bytes(package)
+
+    def get_package(self):
+        if self.package is None:
+            return super().get_package()
+        return list(self.package)
+
+    def set_record(self, record):
+        self.package = None
+        super().set_record(record)
+
+    def decode(self):
+        package = self.package
+        self.package = None
+        for name, decode in self.decoders.items():
+            setattr(self, name, decode(package))
+
+
+LazyRealtimeDataPoint.add_fields()
+
+
 class StorageDataPoint(DataPoint):
+    __slots__ = (
+        'spO2', 'pulse_rate', 'pi', 'pi_support', 'pulse_rate_invalid',
+        'spO2_invalid', 'pi_invalid')
     datatype = 'storage'
+    sample_seconds = 1  # nominal time between datapoints
     specs = {  # {package_type: package_length, ...}
         0x0f: 2,  # one package of 6 bytes split into 3 datapoints
         0x09: 4,
@@ -222,6 +495,51 @@ class StorageDataPoint(DataPoint):
         ('datatype',           "Data Type = {}",          "DataType"),
         ('package_type',       "Package Type = {}",       "PackageType"),
     ]
+    dtype = np.dtype([  # record type for batch decoding, -1: "-"
+        ('spO2',               np.uint8),
+        ('pulse_rate',         np.uint8),
+        ('pi',                 np.int32),
+        ('pi_support',         np.uint8),
+        ('pulse_rate_invalid', np.uint8),
+        ('spO2_invalid',       np.uint8),
+        ('pi_invalid',         np.int8),
+        ('package_type',       np.uint8),
+    ])
+
+    @classmethod
+    def decode_packages(cls, package_types, packages):
+        # split packages of 6 bytes into 3 datapoints without empty ones
+        if packages.shape[1] == 6:
+            package_types = np.repeat(package_types, 3)
+            packages = packages.reshape(-1, 2)
+            filled = (packages[:, 0] != 0) & (packages[:, 1] != 0)
+            package_types = package_types[filled]
+            packages = packages[filled]
+        cls.check_packages(package_types, packages)
+        records = np.zeros(len(packages), dtype=cls.dtype)
+        records['package_type'] = package_types
+
+        # pi support
+        records['pi_support'] = package_types == 0x09
+
+        # packet byte 2|4|6 / package byte 0
+        records['spO2'] = packages[:, 0]
+        records['spO2_invalid'] = packages[:, 0] == 0x7f
+
+        # packet byte 3|5|7 / package byte 1
+        records['pulse_rate'] = packages[:, 1]
+        records['pulse_rate_invalid'] = packages[:, 1] == 0xff
+
+        # packet byte 4-5 / package byte 2-3
+        if packages.shape[1] == 4:
+            pi = packages[:, 3].astype(np.int32) << 8 | packages[:, 2]
+            records['pi'] = pi
+            records['pi_invalid'] = records['pi'] == 0xffff
+        else:
+            records['pi'] = -1
+            records['pi_invalid'] = -1
+
+        return records
 
     def set_package(self, package_type, package, time):
         # pi support
@@ -245,6 +563,19 @@ class StorageDataPoint(DataPoint):
             self.pi = "-"
             self.pi_invalid = "-"
 
+    def get_record(self):
+        if self.pi_support:
+            return super().get_record()
+        return tuple(
+            -1 if name in ['pi', 'pi_invalid'] else getattr(self, name)
+            for name in self.dtype.names)
+
+    def set_record(self, record):
+        super().set_record(record)
+        if not self.pi_support:
+            self.pi = "-"
+            self.pi_invalid = "-"
+
     def get_package(self):
         package = [0] * self.specs[self.package_type]
 
@@ -262,15 +593,1271 @@ class StorageDataPoint(DataPoint):
         return package
 
 
+class DataPointArray():
+    # datapoints kept as typed columns, materialized on access
+    #
+    # one thread may append while another one reads (single producer,
+    # single consumer): rows are written before the count is raised and
+    # never change afterwards, grown columns are filled before they
+    # replace the old ones. readers take the count once and slice every
+    # column up to it.
+    def __init__(self, DataPointClass, capacity=1024):
+        self.DataPointClass = DataPointClass
+        self.count = 0
+        self.columns = {'time': np.zeros(capacity, dtype='datetime64[us]')}
+        for name in DataPointClass.dtype.names:
+            self.columns[name] = np.zeros(
+                capacity, dtype=DataPointClass.dtype[name])
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for idx in range(0, self.count):
+            yield self[idx]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[idx] for idx in range(*idx.indices(self.count))]
+        if idx < 0:
+            idx += self.count
+        if not 0 <= idx < self.count:
+            raise IndexError("Datapoint index out of range.")
+        record = [
+            self.columns[name][idx].item()
+            for name in self.DataPointClass.dtype.names]
+        return self.DataPointClass.from_record(
+            record, self.columns['time'][idx].item())
+
+    def reserve(self, size):
+        # grows all columns by doubling
+        capacity = len(self.columns['time'])
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity = max(capacity * 2, 1)
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.count] = column[:self.count]
+            self.columns[name] = grown
+
+    def append(self, batch):
+        # batch: {'time': [...], name: [...], ...} with columns of equal size
+        size = len(batch['time'])
+        self.reserve(self.count + size)
+        for name, column in self.columns.items():
+            column[self.count:self.count + size] = batch[name]
+        self.count += size
+
+    def extend(self, datapoints, batch_size=4096, clock=None):
+        datapoints = iter(datapoints)
+        while True:
+            batch = list(itertools.islice(datapoints, batch_size))
+            if not batch:
+                break
+            self.append(self.DataPointClass.get_columns(batch, clock))
+
+    def get_column(self, name, end=None, step=1):
+        # returns a view, not a copy
+        if end is None or end > self.count:
+            end = self.count
+        return self.columns[name][:end:step]
+
+
+class RateEstimator():
+    # streaming sample rate, jitter and gaps of timestamps in seconds
+    def __init__(self, window=600, smoothing=0.01, gap_factor=3.0,
+                 min_intervals=10):
+        self.smoothing = smoothing  # weight of a new interval in the average
+        self.gap_factor = gap_factor  # gaps are intervals this much longer
+        self.min_intervals = min_intervals  # before gaps are detected
+        self.count = 0
+        self.timestamp = None
+        self.interval = None  # moving average of seconds between samples
+        self.intervals = collections.deque(maxlen=window)
+        self.intervals_sum = 0.0
+        self.gaps = collections.deque(maxlen=100)  # [(start, seconds), ...]
+        self.gap_count = 0
+
+    @staticmethod
+    def get_seconds(times):
+        # converts datetime64 to seconds since the epoch
+        times = np.asarray(times).astype('datetime64[us]')
+        return times.astype(np.int64) / 10**6
+
+    def is_gap(self, interval):
+        return (len(self.intervals) >= self.min_intervals
+                and interval > self.gap_factor * self.interval)
+
+    def update(self, timestamp):
+        self.count += 1
+        if self.timestamp is None:
+            self.timestamp = timestamp
+            return
+        interval = timestamp - self.timestamp
+        self.timestamp = timestamp
+
+        # gaps are not part of the rate
+        if self.is_gap(interval):
+            self.gaps.append((timestamp - interval, interval))
+            self.gap_count += 1
+            return
+
+        # window
+        if len(self.intervals) == self.intervals.maxlen:
+            self.intervals_sum -= self.intervals[0]
+        self.intervals.append(interval)
+        self.intervals_sum += interval
+
+        # moving average
+        if self.interval is None:
+            self.interval = interval
+        self.interval += self.smoothing * (interval - self.interval)
+
+    def update_many(self, timestamps):
+        # vectorized update, gaps are judged by the average before the batch
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if not len(timestamps):
+            return
+        if self.timestamp is None:
+            self.update(float(timestamps[0]))
+            timestamps = timestamps[1:]
+        if len(timestamps) < self.min_intervals:
+            for timestamp in timestamps.tolist():
+                self.update(timestamp)
+            return
+        intervals = np.diff(timestamps, prepend=self.timestamp)
+        self.count += len(timestamps)
+        self.timestamp = float(timestamps[-1])
+
+        # gaps are not part of the rate
+        interval = self.interval
+        if len(self.intervals) < self.min_intervals:
+            interval = np.median(intervals)
+        gaps = intervals > self.gap_factor * interval
+        for start, seconds in zip(
+                (timestamps[gaps] - intervals[gaps]).tolist(),
+                intervals[gaps].tolist()):
+            self.gaps.append((start, seconds))
+        self.gap_count += int(gaps.sum())
+        intervals = intervals[~gaps]
+        if not len(intervals):
+            return
+
+        # window
+        self.intervals.extend(intervals[-self.intervals.maxlen:].tolist())
+        self.intervals_sum = sum(self.intervals)
+
+        # moving average, older intervals have negligible weights
+        intervals = intervals[-int(20 / self.smoothing):]
+        if self.interval is None:
+            self.interval = float(intervals[0])
+        weights = (1 - self.smoothing) ** np.arange(len(intervals))[::-1]
+        self.interval = float(
+            weights[0] * (1 - self.smoothing) * self.interval
+            + self.smoothing * (weights * intervals).sum())
+
+    def get_rate(self):
+        # samples per second of the moving average
+        if not self.interval:
+            return 0
+        return 1 / self.interval
+
+    def get_window_rate(self):
+        # samples per second within the window
+        if not self.intervals_sum:
+            return 0
+        return len(self.intervals) / self.intervals_sum
+
+    def get_jitter(self, percentiles=(50, 95, 99)):
+        # percentiles of the deviation from the mean interval in seconds
+        if not self.intervals:
+            return {percentile: 0 for percentile in percentiles}
+        intervals = np.array(self.intervals)
+        deviations = np.abs(intervals - intervals.mean())
+        return dict(zip(
+            percentiles, np.percentile(deviations, percentiles).tolist()))
+
+    def get_stats(self):
+        return {
+            'count': self.count,
+            'rate': self.get_rate(),
+            'window_rate': self.get_window_rate(),
+            'jitter': self.get_jitter(),
+            'gaps': self.gap_count,
+        }
+
+
+class PacketBuffer():
+    sync_pattern = re.compile(b'[\x00-\x7f]')  # bytes with sync bit unset
+
+    def __init__(self, resync=False, lengths=None, padded=()):
+        self.buffer = bytearray()
+        self.offset = 0
+        self.resync = resync
+        self.lengths = lengths or {}  # {package_type: packets length, ...}
+        self.padded = padded  # package types with padding after the length
+        self.skipping = False  # drop bytes up to the next synchronization
+        self.excess = False  # bytes after complete packets are too many
+        self.discards = {  # {error class: discarded packets, ...}
+            'unsynchronized': 0,
+            'too_few_bytes': 0,
+            'too_many_bytes': 0,
+            'invalid_package': 0,
+        }
+
+    def __len__(self):
+        return len(self.buffer) - self.offset
+
+    def feed(self, data):
+        # drop consumed bytes before growing the buffer
+        if self.offset:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+
+    def clear(self):
+        del self.buffer[:]
+        self.offset = 0
+        self.skipping = False
+        self.excess = False
+
+    def discard(self, error, message, stop):
+        # raises the error or drops the bytes up to stop in resync mode
+        if not self.resync:
+            raise ValueError(message)
+        self.discards[error] += 1
+        self.offset = stop
+
+    def skip(self):
+        # drops bytes up to the next synchronization byte after the first
+        match = self.sync_pattern.search(self.buffer, self.offset + 1)
+        self.offset = match and match.start() or len(self.buffer)
+        self.skipping = match is None
+
+    def pop_byte(self):
+        if not len(self):
+            return None
+        byte = self.buffer[self.offset]
+        self.offset += 1
+        return byte
+
+    def next_packets(self):
+        # returns the next complete packets or None, if more bytes are needed
+        while True:
+            start = self.offset
+            end = len(self.buffer)
+            if start == end:
+                return None
+
+            # skip bytes up to the next synchronization byte
+            if self.buffer[start] & 0x80:
+                match = self.sync_pattern.search(self.buffer, start)
+                stop = match and match.start() or end
+                if self.excess:
+                    self.discard(
+                        'too_many_bytes',
+                        "Received too many bytes for packets.", stop)
+                elif not self.skipping:
+                    self.discard(
+                        'unsynchronized',
+                        "Received bytes before synchronization.", stop)
+                self.offset = stop
+                self.skipping = match is None
+                continue
+            self.skipping = False
+            self.excess = False
+
+            # packets of known length are complete without the next one
+            length = self.lengths.get(self.buffer[start])
+            if length and end - start >= length:
+                stop = start + length
+                if not self.sync_pattern.search(self.buffer, start + 1, stop):
+                    if self.buffer[start] in self.padded:
+                        self.offset = stop
+                        self.skipping = True  # drop padding of the packets
+                        return list(self.buffer[start:stop])
+                    if stop < end and self.buffer[stop] & 0x80:
+                        match = self.sync_pattern.search(self.buffer, stop)
+                        self.discard(
+                            'too_many_bytes',
+                            "Received too many bytes for packets.",
+                            match and match.start() or end)
+                        self.skipping = match is None
+                        continue
+                    # resync mode waits for the next byte to drop the
+                    # packets with excess bytes as a whole
+                    if stop < end or not self.resync:
+                        self.offset = stop
+                        self.excess = stop == end
+                        return list(self.buffer[start:stop])
+                    return None
+
+            # packets are terminated by the next synchronization byte
+            match = self.sync_pattern.search(self.buffer, start + 1)
+            if match is None:
+                if end - start > 9:
+                    self.discard(
+                        'too_many_bytes',
+                        "Received too many bytes for packets.", end)
+                    self.skipping = True
+                    continue
+                return None
+            stop = match.start()
+            if stop - start < 3:
+                self.discard(
+                    'too_few_bytes',
+                    "Recieved too few bytes for packets.", stop)
+                continue
+            if stop - start > 9:
+                self.discard(
+                    'too_many_bytes',
+                    "Received too many bytes for packets.", stop)
+                continue
+            self.offset = stop
+            return list(self.buffer[start:stop])
+
+    def flush(self):
+        # returns the remaining bytes as last packets
+        if self.skipping:
+            self.clear()
+        if len(self) > 9:
+            raise ValueError("Received too many bytes for packets.")
+        packets = list(self.buffer[self.offset:])
+        self.clear()
+        return packets
+
+
+class StorageCache():
+    def __init__(self, directory=None, fingerprint_packets=8):
+        if not directory:
+            directory = os.path.join(
+                os.path.expanduser('~'), '.cache', 'cms50dplus7')
+        self.directory = directory
+        self.fingerprint_packets = fingerprint_packets
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def get_key(user_index, storage_segment, packets_list):
+        # sessions are identified by their first packets
+        fingerprint = hashlib.sha1()
+        for packets in packets_list:
+            fingerprint.update(bytes(packets))
+        return "{:02x}-{:02x}-{}".format(
+            user_index, storage_segment, fingerprint.hexdigest())
+
+    def get_path(self, key, partial=False):
+        extension = partial and 'part' or 'raw'
+        return os.path.join(self.directory, "{}.{}".format(key, extension))
+
+    def load(self, key):
+        # returns the packets of a complete download or None
+        try:
+            with open(self.get_path(key), 'rb') as cachefile:
+                data = cachefile.read()
+        except FileNotFoundError:
+            return None
+        buffer = PacketBuffer()
+        buffer.feed(data)
+        packets_list = list(iter(buffer.next_packets, None))
+        if len(buffer):
+            packets_list.append(buffer.flush())
+        return packets_list
+
+    def count_partial(self, key):
+        try:
+            with open(self.get_path(key, partial=True), 'rb') as cachefile:
+                data = cachefile.read()
+        except FileNotFoundError:
+            return 0
+        return len(PacketBuffer.sync_pattern.findall(data))
+
+    def open_partial(self, key):
+        return open(self.get_path(key, partial=True), 'ab')
+
+    def finalize(self, key):
+        os.replace(self.get_path(key, partial=True), self.get_path(key))
+
+
+class RawCapture():
+    magic = b'CMS50D+\x01'  # file signature and format version
+    DataPointClass = RealtimeDataPoint  # of get_columns(), set on load
+    dtype = np.dtype([  # frame record
+        ('time',    '<i8'),      # nanoseconds since the epoch
+        ('length',  'u1'),
+        ('packets', 'u1', 9),    # zero padded
+    ])
+    index_dtype = np.dtype([  # time of every index_interval-th frame
+        ('time',    '<i8'),
+        ('frame',   '<i8'),
+    ])
+    record = struct.Struct('<qB9s')
+    index_record = struct.Struct('<qq')
+
+    def __init__(self, filename, index_interval=1024):
+        self.filename = filename
+        self.index_filename = filename + '.idx'
+        self.index_interval = index_interval
+        self.frame_count = 0
+        self.frames = np.zeros(0, dtype=self.dtype)
+        self.index = np.zeros(0, dtype=self.index_dtype)
+        self.capturefile = None
+        self.indexfile = None
+        self.clock = None
+        if os.path.exists(filename):
+            self.load()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def count_frames(self):
+        # frames of a torn last record are not counted
+        size = os.path.getsize(self.filename) - len(self.magic)
+        with open(self.filename, 'rb') as capturefile:
+            if capturefile.read(len(self.magic)) != self.magic:
+                raise ValueError("Invalid capture file.")
+        return max(size, 0) // self.dtype.itemsize
+
+    def load_index(self, count):
+        try:
+            index = np.fromfile(self.index_filename, dtype=self.index_dtype)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=self.index_dtype)
+        return index[index['frame'] < count]
+
+    def load(self):
+        # maps the frames read only, they are decoded on access
+        count = self.count_frames()
+        self.frames = np.zeros(0, dtype=self.dtype)
+        if count:
+            self.frames = np.memmap(
+                self.filename, dtype=self.dtype, mode='r',
+                offset=len(self.magic), shape=(count,))
+        self.index = self.load_index(count)
+
+        # storage captures start with storage packets
+        package_types = self.frames['packets'][:16, 0]
+        self.DataPointClass = RealtimeDataPoint
+        if np.isin(package_types, list(StorageDataPoint.specs)).any():
+            self.DataPointClass = StorageDataPoint
+
+    def open(self):
+        # appends frames, a torn last record is dropped
+        if not os.path.exists(self.filename):
+            with open(self.filename, 'wb') as capturefile:
+                capturefile.write(self.magic)
+        self.frame_count = self.count_frames()
+        self.clock = SessionClock()
+        self.capturefile = open(self.filename, 'ab')
+        self.capturefile.truncate(
+            len(self.magic) + self.frame_count * self.dtype.itemsize)
+        index = self.load_index(self.frame_count)
+        self.indexfile = open(self.index_filename, 'ab')
+        self.indexfile.truncate(len(index) * self.index_dtype.itemsize)
+
+    def close(self):
+        for openfile in [self.capturefile, self.indexfile]:
+            if openfile is not None:
+                openfile.close()
+        self.capturefile = self.indexfile = None
+        self.load()
+
+    def write(self, packets, timestamp=None):
+        if timestamp is None:
+            timestamp = self.clock.get_epoch_nanoseconds(self.clock.now())
+        timestamp = SessionClock.to_nanoseconds(timestamp)
+        if not self.frame_count % self.index_interval:
+            self.indexfile.write(
+                self.index_record.pack(timestamp, self.frame_count))
+        self.capturefile.write(
+            self.record.pack(timestamp, len(packets), bytes(packets)))
+        self.frame_count += 1
+
+    def record_packets(self, packets_list):
+        for packets in packets_list:
+            self.write(packets)
+            yield packets
+
+    def find(self, timestamp):
+        # returns the number of the first frame at or after the timestamp
+        timestamp = SessionClock.to_nanoseconds(timestamp)
+        block = np.searchsorted(self.index['time'], timestamp, 'right')
+        start, stop = 0, len(self.frames)
+        if block:
+            start = self.index['frame'][block - 1]
+        if block < len(self.index):
+            stop = self.index['frame'][block]
+        return int(start + np.searchsorted(
+            self.frames['time'][start:stop], timestamp))
+
+    def get_frames(self, starttime=None, endtime=None):
+        start, stop = 0, len(self.frames)
+        if starttime is not None:
+            start = self.find(starttime)
+        if endtime is not None:
+            stop = self.find(endtime)
+        return self.frames[start:stop]
+
+    def get_datapoints(self, starttime=None, endtime=None):
+        for frame in self.get_frames(starttime, endtime):
+            package_type, package = CMS50Dplus.decode_package(
+                frame['packets'][:frame['length']].tolist())
+            timestamp = SessionClock.to_datetime(int(frame['time']))
+            if package_type in RealtimeDataPoint.specs:
+                yield RealtimeDataPoint(package_type, package, timestamp)
+            elif package_type in StorageDataPoint.specs:
+                for package in CMS50Dplus.split_storage_package(
+                        package_type, package):
+                    yield StorageDataPoint(package_type, package, timestamp)
+
+    def get_columns(self, starttime=None, endtime=None, names=None):
+        return self.decode_frames(self.get_frames(starttime, endtime), names)
+
+    def get_batches(self, batch_size=65536):
+        for start in range(0, len(self.frames), batch_size):
+            yield self.decode_frames(
+                self.frames[start:start + batch_size])
+
+    def decode_frames(self, frames, names=None):
+        # decodes the frames of the capture's datatype at once
+        if self.DataPointClass is StorageDataPoint:
+            records, times = self.decode_storage_frames(frames)
+        else:
+            frames = frames[
+                (frames['length'] == 9) & (frames['packets'][:, 0] == 0x01)]
+            package_types, packages = CMS50Dplus.decode_packages(
+                frames['packets'])
+            records = RealtimeDataPoint.decode_packages(
+                package_types, packages)
+            times = np.asarray(frames['time'])
+
+        # columns, times in local time like the datapoints
+        columns = {name: records[name] for name in records.dtype.names}
+        if len(times):
+            first = int(times[0])
+            times = (np.datetime64(SessionClock.to_datetime(first), 'us')
+                     + ((times - first) // 1000).astype('timedelta64[us]'))
+        columns['time'] = times.astype('datetime64[us]')
+        if names is not None:
+            columns = {
+                name: column for name, column in columns.items()
+                if name in names or name == 'time'}
+        return columns
+
+    @staticmethod
+    def decode_storage_frames(frames):
+        # returns the records and their frame times in frame order, one
+        # package of 6 bytes holds 3 datapoints, empty ones are skipped
+        records = []
+        positions = []
+        for package_type, length in [(0x0f, 8), (0x09, 6)]:
+            selected = np.flatnonzero(
+                (frames['length'] == length)
+                & (frames['packets'][:, 0] == package_type))
+            package_types, packages = CMS50Dplus.decode_packages(
+                frames['packets'][selected, :length])
+            counts = 1
+            if package_type == 0x0f:
+                counts = (packages.reshape(-1, 3, 2) != 0).all(axis=2).sum(
+                    axis=1)
+            records.append(
+                StorageDataPoint.decode_packages(package_types, packages))
+            positions.append(np.repeat(selected, counts))
+        positions = np.concatenate(positions)
+        order = np.argsort(positions, kind='stable')
+        return (np.concatenate(records)[order],
+                np.asarray(frames['time'])[positions[order]])
+
+
+class SessionFile():
+    # columns in compressed chunks, each followed by its chunk table entry:
+    #
+    #   magic | header (json) | trailer
+    #         | chunk column data ... | entry (json) | trailer | ...
+    #
+    # entries point to the trailer before them. chunks are only appended
+    # and their trailer is written last, so a recording interrupted while
+    # writing a chunk stays readable up to the chunk before.
+    magic = b'CMS50DS\x02'  # file signature and format version
+    extension = '.cms50'
+    trailer = struct.Struct('<q8s')  # entry offset, magic
+    delta_columns = ['time', 'pulse_waveform']  # stored as differences
+    compressors = {  # {compression: (compress, decompress), ...}
+        'zlib': (zlib.compress, zlib.decompress),
+        'lzma': (lzma.compress, lzma.decompress),
+        'none': (bytes, bytes),
+    }
+
+    def __init__(self, filename, DataPointClass=None, chunk_size=65536,
+                 compression='zlib', clock=None, append=True):
+        if compression not in self.compressors:
+            raise ValueError("Compression unknown.")
+        self.filename = filename
+        self.DataPointClass = DataPointClass
+        self.chunk_size = chunk_size
+        self.compression = compression
+        self.clock = clock  # SessionClock of monotonic datapoint times
+        self.columns = []  # [(name, dtype, delta), ...]
+        self.chunks = []  # [(count, time_start, time_end, [(offset,
+        #                    length), ...] per column), ...]
+        self.data = np.zeros(0, dtype=np.uint8)
+        self.sessionfile = None
+        self.data_end = len(self.magic)
+        self.last_trailer = None  # offset of the last trailer
+        self.datapoints = []  # written, not yet in columns
+        self.pending = []  # columns, not yet in chunks
+        self.stats = {'rows': 0, 'chunks': 0}
+        if append and os.path.exists(filename) and os.path.getsize(filename):
+            self.load()
+            if DataPointClass not in [None, self.DataPointClass]:
+                raise ValueError("Datatype mismatch.")
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return sum(chunk[0] for chunk in self.chunks)
+
+    def set_columns(self, DataPointClass):
+        self.DataPointClass = DataPointClass
+        self.columns = [('time', np.dtype('<i8'), True)] + [
+            (name, DataPointClass.dtype[name],
+             name in self.delta_columns)
+            for name in DataPointClass.dtype.names]
+
+    def load(self):
+        # maps the file read only, chunks are decompressed on access
+        self.data = np.memmap(self.filename, dtype=np.uint8, mode='r')
+        if (len(self.data) < len(self.magic) + self.trailer.size
+                or bytes(self.data[:len(self.magic)]) != self.magic):
+            raise ValueError("Invalid session file.")
+        self.last_trailer = self.find_trailer()
+        self.data_end = self.last_trailer + self.trailer.size
+
+        # follow the entries back to the header
+        chunks = []
+        entry = self.read_entry(self.last_trailer)
+        while 'chunk' in entry:
+            chunks.append(entry['chunk'])
+            entry = self.read_entry(entry['previous'])
+            if entry is None:
+                raise ValueError("Invalid session file.")
+        self.chunks = chunks[::-1]
+        for DataPointClass in [RealtimeDataPoint, StorageDataPoint]:
+            if entry['datatype'] == DataPointClass.datatype:
+                self.DataPointClass = DataPointClass
+        if self.DataPointClass is None:
+            raise ValueError('Datatype unknown.')
+        self.compression = entry['compression']
+        self.columns = [
+            (name, np.dtype(dtype), delta)
+            for name, dtype, delta in entry['columns']]
+
+    def find_trailer(self, window=65536):
+        # offset of the last intact trailer, a torn chunk at the end of an
+        # interrupted recording is skipped
+        stop = len(self.data)
+        shift = self.trailer.size - len(self.magic)  # of the magic
+        while True:
+            start = max(stop - window, 0)
+            data = bytes(self.data[start:stop])
+            idx = data.rfind(self.magic)
+            while idx >= 0:
+                if self.read_entry(start + idx - shift) is not None:
+                    return start + idx - shift
+                idx = data.rfind(self.magic, 0, idx)
+            if not start:
+                raise ValueError("Invalid session file.")
+            stop = start + len(self.magic) - 1
+
+    def read_entry(self, position):
+        # returns the entry before the trailer at position or None
+        if not len(self.magic) <= position <= \
+                len(self.data) - self.trailer.size:
+            return None
+        offset, magic = self.trailer.unpack(
+            bytes(self.data[position:position + self.trailer.size]))
+        if magic != self.magic or not len(self.magic) <= offset < position:
+            return None
+        try:
+            entry = json.loads(bytes(self.data[offset:position]).decode())
+        except ValueError:
+            return None
+        if not isinstance(entry, dict):
+            return None
+        return entry
+
+    def open(self):
+        # appends chunks to an existing file of the same datatype
+        if self.columns:
+            self.sessionfile = open(self.filename, 'r+b')
+        else:
+            if self.DataPointClass is None:
+                raise ValueError('Datatype unknown.')
+            self.set_columns(self.DataPointClass)
+            self.sessionfile = open(self.filename, 'wb')
+            self.sessionfile.write(self.magic)
+            self.write_entry({
+                'datatype': self.DataPointClass.datatype,
+                'compression': self.compression,
+                'columns': [
+                    (name, dtype.str, delta)
+                    for name, dtype, delta in self.columns],
+            })
+        self.data = np.zeros(0, dtype=np.uint8)  # release the map
+
+    def close(self):
+        if self.datapoints:
+            self.append_datapoints()
+        self.flush(final=True)
+        self.sessionfile.close()
+        self.sessionfile = None
+        self.load()
+
+    def write(self, datapoint):
+        self.datapoints.append(datapoint)
+        if len(self.datapoints) >= self.chunk_size:
+            self.append_datapoints()
+
+    def append_datapoints(self):
+        datapoints, self.datapoints = self.datapoints, []
+        self.append(self.DataPointClass.get_columns(datapoints, self.clock))
+
+    def append(self, columns):
+        # columns: {'time': [...], name: [...], ...} like DataPointArray
+        if self.datapoints:
+            self.append_datapoints()
+        self.pending.append(columns)
+        if sum(len(columns['time']) for columns in self.pending) \
+                >= self.chunk_size:
+            self.flush()
+
+    def flush(self, final=False):
+        # writes full chunks, the rest only if final
+        if not self.pending:
+            return
+        columns = {
+            name: np.concatenate([
+                np.asarray(pending[name]) for pending in self.pending])
+            for name, _, _ in self.columns}
+        count = len(columns['time'])
+        start = 0
+        while count - start >= self.chunk_size or final and start < count:
+            stop = min(start + self.chunk_size, count)
+            self.write_chunk({
+                name: column[start:stop]
+                for name, column in columns.items()})
+            start = stop
+        self.pending = []
+        if start < count:
+            self.pending.append({
+                name: column[start:] for name, column in columns.items()})
+
+    def write_chunk(self, columns):
+        compress = self.compressors[self.compression][0]
+        times = np.asarray(columns['time'], dtype='datetime64[us]')
+        entries = []
+        self.sessionfile.seek(self.data_end)
+        for name, dtype, delta in self.columns:
+            column = np.asarray(columns[name])
+            if name == 'time':
+                column = times.astype(np.int64)
+            column = self.encode(column.astype(dtype), delta)
+            data = compress(column.tobytes())
+            self.sessionfile.write(data)
+            entries.append((self.data_end, len(data)))
+            self.data_end += len(data)
+        times = times.astype(np.int64)
+        chunk = [len(times), int(times.min()), int(times.max()), entries]
+        self.chunks.append(chunk)
+        self.stats['rows'] += len(times)
+        self.stats['chunks'] += 1
+        self.write_entry({'chunk': chunk, 'previous': self.last_trailer})
+
+    def write_entry(self, entry):
+        # the trailer is written after the data it points to is on disk
+        entry = json.dumps(entry).encode()
+        self.sessionfile.seek(self.data_end)
+        self.sessionfile.write(entry)
+        self.sessionfile.flush()
+        os.fsync(self.sessionfile.fileno())
+        offset, self.last_trailer = self.data_end, self.data_end + len(entry)
+        self.sessionfile.write(self.trailer.pack(offset, self.magic))
+        self.sessionfile.truncate()
+        self.sessionfile.flush()
+        os.fsync(self.sessionfile.fileno())
+        self.data_end = self.last_trailer + self.trailer.size
+
+    @staticmethod
+    def encode(column, delta):
+        # differences wrap around in the column type
+        if delta and len(column):
+            column = np.diff(column, prepend=column.dtype.type(0))
+        return column
+
+    @staticmethod
+    def decode(column, delta):
+        if delta:
+            column = np.cumsum(column, dtype=column.dtype)
+        return column
+
+    def find_chunks(self, starttime=None, endtime=None):
+        # returns the numbers of the chunks overlapping the time range
+        result = []
+        for idx, (count, time_start, time_end, _) in enumerate(self.chunks):
+            if starttime is not None and time_end < self.to_int(starttime):
+                continue
+            if endtime is not None and time_start >= self.to_int(endtime):
+                continue
+            result.append(idx)
+        return result
+
+    @staticmethod
+    def to_int(timestamp):
+        # microseconds of local datetimes like the time column
+        return int(np.datetime64(timestamp, 'us').astype(np.int64))
+
+    def read_chunk(self, idx, names=None):
+        decompress = self.compressors[self.compression][1]
+        entries = self.chunks[idx][3]
+        columns = {}
+        for (name, dtype, delta), (offset, length) in zip(
+                self.columns, entries):
+            if names is not None and name not in names:
+                continue
+            column = np.frombuffer(
+                decompress(self.data[offset:offset + length]), dtype=dtype)
+            column = self.decode(column, delta)
+            if name == 'time':
+                column = column.astype('datetime64[us]')
+            columns[name] = column
+        return columns
+
+    def get_chunks(self, starttime=None, endtime=None, names=None):
+        # yields the columns of each chunk cut to the time range
+        if names is not None:
+            names = set(names) | {'time'}
+        for idx in self.find_chunks(starttime, endtime):
+            columns = self.read_chunk(idx, names)
+            times = columns['time']
+            mask = np.ones(len(times), dtype=bool)
+            if starttime is not None:
+                mask &= times >= np.datetime64(starttime, 'us')
+            if endtime is not None:
+                mask &= times < np.datetime64(endtime, 'us')
+            if not mask.all():
+                columns = {
+                    name: column[mask] for name, column in columns.items()}
+            yield columns
+
+    def get_columns(self, starttime=None, endtime=None, names=None):
+        chunks = list(self.get_chunks(starttime, endtime, names))
+        if not chunks:
+            chunks = [{
+                name: np.zeros(0, dtype=dtype)
+                for name, dtype, _ in self.columns
+                if names is None or name in names}]
+            chunks[0]['time'] = np.zeros(0, dtype='datetime64[us]')
+        return {
+            name: np.concatenate([chunk[name] for chunk in chunks])
+            for name in chunks[0]}
+
+    def get_batches(self, batch_size=None):
+        return self.get_chunks()
+
+    def get_points(self, starttime=None, endtime=None):
+        points = DataPointArray(self.DataPointClass)
+        for columns in self.get_chunks(starttime, endtime):
+            points.append(columns)
+        return points
+
+    def get_datapoints(self, starttime=None, endtime=None):
+        for columns in self.get_chunks(starttime, endtime):
+            points = DataPointArray(self.DataPointClass)
+            points.append(columns)
+            yield from points
+
+
+class CsvFile():
+    # csv files written by this module with a sparse time index in
+    # '<filename>.idx', built on first open and extended as the file grows.
+    # rows are expected in time order.
+    index_magic = b'CMS50DI\x01'  # index signature and format version
+    index_header = struct.Struct('<8sqqq')  # magic, interval, size, rows
+    index_dtype = np.dtype([  # time and offset of every index_interval-th row
+        ('time',    '<i8'),      # microseconds of the local time
+        ('offset',  '<i8'),
+    ])
+
+    def __init__(self, filename, index_interval=1024, save_index=True):
+        self.filename = filename
+        self.index_filename = filename + '.idx'
+        self.index_interval = index_interval
+        self.save_index = save_index  # or keep a new index in memory only
+        self.DataPointClass = get_csv_class(filename)
+        if self.DataPointClass is None:
+            raise ValueError("Invalid csv file.")
+        self.header = self.DataPointClass.get_csv_header()
+        self.size = 0  # bytes of complete rows
+        self.rows = 0
+        self.index = np.zeros(0, dtype=self.index_dtype)
+        self.load_index()
+        if self.size != os.path.getsize(filename):
+            self.update_index()
+
+    def __len__(self):
+        return self.rows
+
+    def load_index(self):
+        try:
+            with open(self.index_filename, 'rb') as indexfile:
+                magic, interval, size, rows = self.index_header.unpack(
+                    indexfile.read(self.index_header.size))
+                index = np.frombuffer(
+                    indexfile.read(), dtype=self.index_dtype)
+        except (OSError, struct.error, ValueError):
+            return
+        if (magic != self.index_magic or interval != self.index_interval
+                or size > os.path.getsize(self.filename)):
+            return
+        if len(index):  # the file may have been rewritten
+            with open(self.filename, 'rb') as csvfile:
+                csvfile.seek(index['offset'][-1])
+                try:
+                    if self.get_time(csvfile.readline()) != index['time'][-1]:
+                        return
+                except ValueError:
+                    return
+        self.size, self.rows, self.index = size, rows, index
+
+    def update_index(self):
+        # indexes the rows after the indexed ones, torn rows are skipped
+        index = []
+        with open(self.filename, 'rb') as csvfile:
+            if not self.size:
+                self.size = len(csvfile.readline())  # header
+            csvfile.seek(self.size)
+            for line in csvfile:
+                if not line.endswith(b'\n'):
+                    break
+                if not self.rows % self.index_interval:
+                    index.append((self.get_time(line), self.size))
+                self.size += len(line)
+                self.rows += 1
+        self.index = np.concatenate([
+            self.index, np.array(index, dtype=self.index_dtype)])
+        if not self.save_index:
+            return
+        try:
+            with open(self.index_filename, 'wb') as indexfile:
+                indexfile.write(self.index_header.pack(
+                    self.index_magic, self.index_interval, self.size,
+                    self.rows))
+                indexfile.write(self.index.tobytes())
+        except OSError:  # read only, the index is kept in memory
+            pass
+
+    @staticmethod
+    def to_int(timestamp):
+        # microseconds of local datetimes like the time column
+        return int(np.datetime64(timestamp, 'us').astype(np.int64))
+
+    @classmethod
+    def get_time(cls, line):
+        return cls.to_int(line.split(b',', 1)[0].strip(b'"').decode())
+
+    def find(self, timestamp, default):
+        # returns the offset of the last indexed row before the timestamp
+        block = np.searchsorted(
+            self.index['time'], self.to_int(timestamp), 'left')
+        if block:
+            return int(self.index['offset'][block - 1])
+        return default
+
+    def get_columns(self, starttime=None, endtime=None, names=None):
+        # reads the indexed blocks covering the time range only
+        start = stop = self.size
+        if len(self.index):
+            start = int(self.index['offset'][0])
+        if starttime is not None:
+            start = self.find(starttime, start)
+        if endtime is not None:
+            block = np.searchsorted(
+                self.index['time'], self.to_int(endtime), 'left')
+            if block < len(self.index):
+                stop = int(self.index['offset'][block])
+        with open(self.filename, 'rb') as csvfile:
+            csvfile.seek(start)
+            data = csvfile.read(max(stop - start, 0)).decode()
+        rows = list(csv.reader(io.StringIO(data)))
+        columns = parse_csv_rows(self.header, rows, self.DataPointClass)
+        times = columns['time']
+        mask = np.ones(len(times), dtype=bool)
+        if starttime is not None:
+            mask &= times >= np.datetime64(starttime, 'us')
+        if endtime is not None:
+            mask &= times < np.datetime64(endtime, 'us')
+        return {
+            name: column[mask] for name, column in columns.items()
+            if names is None or name in names or name == 'time'}
+
+    def get_batches(self, batch_size=65536):
+        return read_csv_columns(
+            self.filename, self.DataPointClass, batch_size)
+
+
+class Recording():
+    # time range queries over csv, session and raw capture files, memory
+    # scales with the requested range
+    def __init__(self, filename, save_index=True):
+        # save_index: keep the index of csv files in '<filename>.idx'
+        self.filename = filename
+        if filename.endswith(SessionFile.extension):
+            self.source = SessionFile(filename)
+        elif filename.endswith('.raw'):
+            self.source = RawCapture(filename)
+        else:
+            self.source = CsvFile(filename, save_index=save_index)
+        self.DataPointClass = self.source.DataPointClass
+
+    def __len__(self):
+        return len(self.source)
+
+    def slice(self, starttime=None, endtime=None, columns=None):
+        # returns {'time': array, name: array, ...} of [starttime, endtime)
+        if starttime is not None:
+            starttime = np.datetime64(starttime, 'us').item()
+        if endtime is not None:
+            endtime = np.datetime64(endtime, 'us').item()
+        return self.source.get_columns(starttime, endtime, columns)
+
+    def get_batches(self, batch_size=65536):
+        # yields the columns of the whole file in batches
+        return self.source.get_batches(batch_size)
+
+    def get_rows(self, source=0, batch_size=65536):
+        # yields (microseconds, source, record) in file order
+        names = self.DataPointClass.dtype.names
+        for batch in self.get_batches(batch_size):
+            times = batch['time'].astype(np.int64).tolist()
+            records = zip(*[batch[name].tolist() for name in names])
+            for timestamp, record in zip(times, records):
+                yield timestamp, source, record
+
+
+class ConversionJournal():
+    # finished conversions as json lines, keyed by the source path
+    # relative to the directory and valid while size and mtime match
+    def __init__(self, filename):
+        self.filename = filename
+        self.jobs = {}
+        try:
+            with open(filename, 'r') as journalfile:
+                for line in journalfile:
+                    try:
+                        job = json.loads(line)
+                    except ValueError:  # torn last line
+                        continue
+                    self.jobs[job['source']] = job
+        except FileNotFoundError:
+            pass
+
+    def is_done(self, source, stat, target):
+        job = self.jobs.get(source)
+        return (job is not None and 'error' not in job
+                and job['size'] == stat.st_size
+                and job['mtime'] == stat.st_mtime_ns
+                and os.path.exists(target))
+
+    def add(self, source, stat, **job):
+        job.update({
+            'source': source,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+        })
+        self.jobs[source] = job
+        with open(self.filename, 'a') as journalfile:
+            journalfile.write(json.dumps(job) + '\n')
+
+
+def convert_recording(source, target):
+    # converts a csv recording into a session file, which replaces the
+    # target when complete. returns the number of rows.
+    directory, basename = os.path.split(target)
+    temporary = os.path.join(directory, '.' + basename)
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    DataPointClass = get_csv_class(source)
+    try:
+        if DataPointClass is None:
+            raise ValueError("Invalid csv file.")
+        with SessionFile(temporary, DataPointClass) as session:
+            for batch in read_csv_columns(source, DataPointClass):
+                session.append(batch)
+    except (ValueError, OverflowError):
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        datapoints = read_csv_data(source)
+        datapoint = next(datapoints, None)
+        if datapoint is None:
+            raise ValueError("No data.")
+        with SessionFile(temporary, datapoint.__class__) as session:
+            for datapoint in itertools.chain([datapoint], datapoints):
+                session.write(datapoint)
+    os.replace(temporary, target)
+    return len(session)
+
+
+def convert_directory(directory, jobs=None, progress=False):
+    # converts the csv recordings below directory into session files next
+    # to them with a process per core. finished files are kept in a
+    # journal in the directory, an interrupted run resumes from there.
+    journal = ConversionJournal(
+        os.path.join(directory, '.cms50dplus7-convert.journal'))
+    stats = {'converted': 0, 'failed': 0, 'skipped': 0, 'errors': []}
+    todo = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.startswith('.') or not filename.endswith('.csv'):
+                continue
+            source = os.path.join(root, filename)
+            target = source[:-len('.csv')] + SessionFile.extension
+            key = os.path.relpath(source, directory)
+            stat = os.stat(source)
+            if journal.is_done(key, stat, target):
+                stats['skipped'] += 1
+                continue
+            todo.append((source, target, key, stat))
+    progress = progress and ProgressBar(len(todo))
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        futures = {
+            executor.submit(convert_recording, source, target): (key, stat)
+            for source, target, key, stat in todo}
+        for count, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            key, stat = futures[future]
+            try:
+                journal.add(key, stat, rows=future.result())
+                stats['converted'] += 1
+            except Exception as e:
+                journal.add(key, stat, error=str(e))
+                stats['failed'] += 1
+                stats['errors'].append((key, str(e)))
+            if progress:
+                progress.update(count, force=count == len(todo))
+    return stats
+
+
+def get_gap_record(names, record):
+    # empty record with invalid values, keeps the package type
+    return [
+        1 if name in ['spO2_invalid', 'pulse_rate_invalid'] else
+        value if name == 'package_type' else 0
+        for name, value in zip(names, record)]
+
+
+def merge_recordings(filenames, filename, tolerance=None, gap_seconds=None,
+                     progress=None):
+    # merges time ordered recordings of one datatype in constant memory.
+    # rows within tolerance seconds after the last written row of another
+    # recording are dropped as duplicates, so overlapping recordings are
+    # not interleaved. the tolerance defaults to one and a half sample
+    # periods. gaps longer than gap_seconds are marked with an empty
+    # invalid datapoint, which plots as a gap.
+    recordings = [Recording(name, save_index=False) for name in filenames]
+    DataPointClass = recordings[0].DataPointClass
+    if any(recording.DataPointClass is not DataPointClass
+           for recording in recordings):
+        raise ValueError("Datatype mismatch.")
+    names = DataPointClass.dtype.names
+    if tolerance is None:
+        tolerance = 1.5 * DataPointClass.sample_seconds
+    tolerance = int(tolerance * 10**6)
+    gap = gap_seconds and int(gap_seconds * 10**6)
+    stats = {'rows': 0, 'duplicates': 0, 'gaps': 0}
+    last_time = None
+    last_times = {}  # {source: time of the last written row, ...}
+    rows = heapq.merge(*[
+        recording.get_rows(source)
+        for source, recording in enumerate(recordings)])
+    with get_writer(filename, DataPointClass) as writer:
+        for timestamp, source, record in rows:
+            if any(timestamp - other_time <= tolerance
+                   for other, other_time in last_times.items()
+                   if other != source):
+                stats['duplicates'] += 1
+                continue
+            if gap and last_time is not None and timestamp - last_time > gap:
+                writer.write(DataPointClass.from_record(
+                    get_gap_record(names, record),
+                    np.datetime64((last_time + timestamp) // 2, 'us').item()))
+                stats['gaps'] += 1
+            writer.write(DataPointClass.from_record(
+                record, np.datetime64(timestamp, 'us').item()))
+            last_time = last_times[source] = timestamp
+            stats['rows'] += 1
+            if progress is not None:
+                progress.update(stats['rows'])
+    return stats
+
+
 class CMS50Dplus():
+    high_bits = [  # [(bit 7 of package byte 0, ...), ...] per high byte
+        tuple((high_byte >> idx & 0x01) << 7 for idx in range(0, 7))
+        for high_byte in range(0, 128)]
+    high_bits_array = np.array(high_bits, dtype=np.uint8)
+    constant_commands = [  # [(command, data), ...] encoded on import
+        (0xa1, ()),            # start realtime data
+        (0xa2, ()),            # stop realtime data
+        (0xa6, (0x01, 0x01)),  # start storage data, default user/segment
+        (0xa7, ()),            # stop storage data
+        (0xaf, ()),            # keepalive
+    ]
+    packet_lengths = {  # {package_type: packets length, ...}
+        0x01: 9,  # realtime data
+        0x09: 6,  # storage data with pi support
+        0x0f: 8,  # storage data without pi support
+        0x0d: 3,  # disconnect notice
+    }
+    padded_packets = [0x0d]  # package types whose padding is dropped
+
     def __init__(self, port='/dev/ttyUSB0', baudrate=115200, timeout=0.5,
-                 connect=True):
+                 connect=True, resync=False):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
+        self.keepalive_jitter = 0.0  # seconds to send keepalives earlier
+        self.keepalive_timestamp = time.monotonic()
+        self.keepalive_stats = {
+            'sent': 0,
+            'missed': 0,  # keepalives sent more than one interval too late
+            'max_delay': 0.0,  # seconds after the deadline
+            'times': collections.deque(maxlen=100),  # monotonic send times
+        }
         self.keepalive_interval = datetime.timedelta(seconds=5)
-        self.keepalive_timestamp = datetime.datetime.now()
         self.storage_time_interval = datetime.timedelta(seconds=1)
+        self.read_size = 4096
+        self.adaptive_timeout = False  # learn the timeout from the cadence
+        self.adaptive_timeout_factor = 10
+        self.min_timeout = 0.05
+        self.read_timeout = timeout
+        self.read_gap = None
+        self.read_timestamp = 0
+        self.buffer = PacketBuffer(
+            resync, self.packet_lengths, self.padded_packets)
+        self.discards = self.buffer.discards
         self.connection = None
         if connect:
             self.connect()
@@ -278,6 +1865,15 @@ class CMS50Dplus():
     def __del__(self):
         self.disconnect()
 
+    @property
+    def resync(self):
+        # drop invalid packets instead of raising, kept by the buffer
+        return self.buffer.resync
+
+    @resync.setter
+    def resync(self, resync):
+        self.buffer.resync = resync
+
     @staticmethod
     def set_bit(byte, value=1, index=7):
         mask = 1 << index
@@ -307,11 +1903,40 @@ class CMS50Dplus():
         package = packets[2:]
 
         # decode high byte
-        for idx, byte in enumerate(package):
-            package[idx] = cls.set_bit(byte, high_byte & 0x01 << idx)
+        package = [
+            byte & 0x7f | bit
+            for byte, bit in zip(package, cls.high_bits[high_byte & 0x7f])]
 
         return package_type, package
 
+    @classmethod
+    def decode_packages(cls, packets):
+        # decodes packets of equal length given as array of shape (n, length)
+        packets = np.asarray(packets, dtype=np.uint8)
+        if packets.ndim != 2:
+            raise ValueError("Packets must be a two dimensional array.")
+
+        # check packet length
+        if packets.shape[1] < 3:
+            raise ValueError("Package too short to decode.")
+        if packets.shape[1] > 9:
+            raise ValueError("Package too long to decode")
+
+        # check synchronization bits
+        if (packets[:, 0] & 0x80).any() or not (packets[:, 1:] & 0x80).all():
+            raise ValueError("Invalid synchronization bit.")
+
+        # define packet parts
+        package_types = packets[:, 0].copy()
+        high_bytes = packets[:, 1]
+        package = packets[:, 2:]
+
+        # decode high byte
+        high_bits = cls.high_bits_array.take(high_bytes & 0x7f, axis=0)
+        packages = (package & 0x7f) | high_bits[:, :package.shape[1]]
+
+        return package_types, packages
+
     @classmethod
     def encode_package(cls, package_type, package,
                        padding=0, padding_byte=0x00):
@@ -346,6 +1971,18 @@ class CMS50Dplus():
 
         return packets
 
+    @classmethod
+    @functools.lru_cache(maxsize=256)
+    def encode_command(cls, command, data=()):
+        return bytes(cls.encode_package(
+            package_type=0x7d,  # command
+            package=[command] + list(data), padding=7, padding_byte=0x00))
+
+    @classmethod
+    def cache_commands(cls):
+        for command, data in cls.constant_commands:
+            cls.encode_command(command, data)
+
     def is_connected(self):
         if self.connection and self.connection.isOpen():
             return True
@@ -369,18 +2006,52 @@ class CMS50Dplus():
         if self.is_connected():
             self.connection.close()
 
+    def read_buffer(self):
+        size = min(max(self.connection.in_waiting, 1), self.read_size)
+        data = self.connection.read(size)
+        self.buffer.feed(data)
+        if data and self.adaptive_timeout:
+            self.adapt_timeout()
+        return len(data)
+
+    def start_adaptive_timeout(self):
+        self.adaptive_timeout = True
+        self.read_gap = None
+        self.read_timestamp = time.monotonic()
+
+    def stop_adaptive_timeout(self):
+        self.adaptive_timeout = False
+        if self.read_timeout != self.timeout:
+            self.read_timeout = self.connection.timeout = self.timeout
+
+    def adapt_timeout(self):
+        # moving average of the time between reads
+        now = time.monotonic()
+        gap = now - self.read_timestamp
+        self.read_timestamp = now
+        if self.read_gap is None:
+            self.read_gap = gap
+        self.read_gap += 0.1 * (gap - self.read_gap)
+
+        # reconfigure the port only on significant changes
+        timeout = self.read_gap * self.adaptive_timeout_factor
+        timeout = min(max(timeout, self.min_timeout), self.timeout)
+        if abs(timeout - self.read_timeout) > 0.25 * self.read_timeout:
+            self.read_timeout = self.connection.timeout = timeout
+
+    def reset_input_buffer(self):
+        self.buffer.clear()
+        self.connection.reset_input_buffer()
+
     def get_byte(self):
-        char = self.connection.read()
-        if len(char) == 0:
+        if not len(self.buffer) and not self.read_buffer():
             return None
-        else:
-            return ord(char)
+        return self.buffer.pop_byte()
 
     def send_bytes(self, values):
-        return self.connection.write(
-            b''.join([
-                chr(value & 0xff).encode('raw_unicode_escape')
-                for value in values]))
+        if not isinstance(values, (bytes, bytearray, memoryview)):
+            values = bytes(value & 0xff for value in values)
+        return self.connection.write(values)
 
     def expect_byte(self, value):
         while True:
@@ -391,102 +2062,1087 @@ class CMS50Dplus():
                 return True
 
     def send_command(self, command, data=[]):
-        package = self.encode_package(
-            package_type=0x7d,  # command
-            package=[command] + data, padding=7, padding_byte=0x00)
-        self.send_bytes(package)
+        self.send_bytes(self.encode_command(command, tuple(data)))
         self.connection.flush()
 
+    @property
+    def keepalive_interval(self):
+        return datetime.timedelta(seconds=self.keepalive_seconds)
+
+    @keepalive_interval.setter
+    def keepalive_interval(self, interval):
+        self.keepalive_seconds = interval.total_seconds()
+        self.schedule_keepalive()
+
+    def schedule_keepalive(self):
+        jitter = self.keepalive_jitter and random.uniform(
+            0, self.keepalive_jitter)
+        self.keepalive_deadline = (
+            self.keepalive_timestamp + self.keepalive_seconds - jitter)
+
     def send_keepalive(self):
-        now = datetime.datetime.now()
-        if now - self.keepalive_timestamp > self.keepalive_interval:
-            self.send_command(0xaf)  # keepalive
-            self.keepalive_timestamp = now
+        now = time.monotonic()
+        if now < self.keepalive_deadline:
+            return
+        self.send_command(0xaf)  # keepalive
+
+        # statistics
+        delay = now - self.keepalive_deadline
+        stats = self.keepalive_stats
+        stats['sent'] += 1
+        stats['times'].append(now)
+        if delay > self.keepalive_seconds:
+            stats['missed'] += 1
+        if delay > stats['max_delay']:
+            stats['max_delay'] = delay
+
+        self.keepalive_timestamp = now
+        self.schedule_keepalive()
+
+    def flush_packets(self, count, amount):
+        # returns the last packets at the end of the stream or None
+        packets = self.buffer.flush()
+        length = packets and self.packet_lengths.get(packets[0]) or 3
+        if len(packets) < length:
+            if not self.resync and (packets or not count):
+                raise ValueError("Recieved too few bytes for packets.")
+            if packets:
+                self.discards['too_few_bytes'] += 1
+            packets = None
+        if amount and count + bool(packets) < amount:
+            raise ValueError("Recieved too few packets.")
+        return packets
 
     def get_packets(self, amount=0):
         count = 0
-        idx = 0
-        packets = []
         while True:
-            if not amount:
-                self.send_keepalive()
-            byte = self.get_byte()
-            if byte is None:
-                if len(packets[:idx]) < 3:
-                    raise ValueError("Recieved too few bytes for packets.")
-                if amount and count + 1 < amount:
-                    raise ValueError("Recieved too few packets.")
-                yield packets[:idx]
-                break
-            sync_bit = bool(byte & 0x80)
-            if not sync_bit:
+            packets = self.buffer.next_packets()
+            if packets is None:
+                if not amount:
+                    self.send_keepalive()
+                if self.read_buffer():
+                    continue
+                packets = self.flush_packets(count, amount)
                 if packets:
-                    if len(packets[:idx]) < 3:
-                        raise ValueError("Recieved too few bytes for packets.")
-                    yield packets[:idx]
-                    if amount:
-                        count += 1
-                        if count == amount:
-                            break
-                packets = [0x00] * 9
-                idx = 0
-            if idx > 8:
-                raise ValueError("Received too many bytes for packets.")
-            packets[idx] = byte
-            idx += 1
-
-    def get_packages(self, amount=0):
-        for packets in self.get_packets(amount):
+                    yield packets
+                break
+            yield packets
+            count += 1
+            if count == amount:
+                break
+
+    def is_disconnect_notice(self, package_type, package):
+        # notices with unknown reason codes are dropped in resync mode
+        if package_type != 0x0d:  # disconnect notice
+            return False
+        if package[0] in [0x00, 0x01]:
+            return True
+        if not self.resync:
+            raise ValueError(
+                "Received reasoncode 0x{:02X}".format(package[0]))
+        self.discards['invalid_package'] += 1
+        return False
+
+    @staticmethod
+    def split_storage_package(package_type, package):
+        # one package of 6 bytes contains 3 datapoints, empty ones are skipped
+        if package_type != 0x0f:
+            return [package]
+        return [
+            package[idx:idx + 2] for idx in [0, 2, 4]
+            if package[idx] and package[idx + 1]]
+
+    @classmethod
+    def count_storage_datapoints(cls, packets):
+        # number of non-empty datapoints in storage packets
+        return len(cls.split_storage_package(*cls.decode_package(packets)))
+
+    def make_datapoint(self, DataPointClass, package_type, package,
+                       time=False):
+        # returns None for invalid packages in resync mode
+        try:
+            return DataPointClass(package_type, package, time)
+        except ValueError:
+            if not self.resync:
+                raise
+            self.discards['invalid_package'] += 1
+            return None
+
+    def get_packages(self, amount=0, packets_list=None):
+        if packets_list is None:
+            packets_list = self.get_packets(amount)
+        for packets in packets_list:
             package_type, package = self.decode_package(packets)
-            if package_type == 0x0d:  # disconnect notice
-                if package[0] in [0x00, 0x01]:
-                    break
-                raise ValueError(
-                    "Received reasoncode 0x{:02X}".format(package[0]))
+            if self.is_disconnect_notice(package_type, package):
+                break
+            if package_type == 0x0d:  # dropped notice
+                continue
             yield package_type, package
 
-    def get_realtime_data(self):
+    def get_realtime_data(self, capture=None, lazy=False, clock=None):
+        # capture: RawCapture opened for appending the raw frames
+        # lazy: decode attributes on first access
+        # clock: SessionClock to stamp datapoints with monotonic time
+        DataPointClass = RealtimeDataPoint
+        if lazy:
+            DataPointClass = LazyRealtimeDataPoint
         try:
-            self.connection.reset_input_buffer()
+            self.reset_input_buffer()
             self.send_command(0xa1)  # start realtime data
-            for package_type, package in self.get_packages():
-                yield RealtimeDataPoint(package_type, package)
+            packets_list = self.get_packets()
+            if capture is not None:
+                packets_list = capture.record_packets(packets_list)
+            for package_type, package in self.get_packages(
+                    packets_list=packets_list):
+                datapoint = self.make_datapoint(
+                    DataPointClass, package_type, package,
+                    clock and clock.now())
+                if datapoint:
+                    yield datapoint
         except KeyboardInterrupt:
             pass
         finally:
             self.send_command(0xa2)  # stop realtime data
 
+    def get_storage_packets(self, user_index, storage_segment, cache=None,
+                            points=None):
+        # points: expected number of datapoints, completes the download
+        packets_list = self.get_packets()
+        if cache is None:
+            yield from packets_list
+            return
+
+        # serve known sessions from the cache
+        head = list(itertools.islice(packets_list, cache.fingerprint_packets))
+        key = cache.get_key(user_index, storage_segment, head)
+        cached = cache.load(key)
+        if cached is not None:
+            self.send_command(0xa7)  # stop storage data
+            yield from cached
+            return
+
+        # persist packets, skip those persisted by an interrupted download
+        persisted = cache.count_partial(key)
+        discards = self.discards['too_few_bytes']
+        complete = True
+        count = 0
+        packets = None
+        with cache.open_partial(key) as cachefile:
+            packets_list = itertools.chain(head, packets_list)
+            for idx, packets in enumerate(packets_list):
+                if idx >= persisted:
+                    cachefile.write(bytes(packets))
+                if packets[0] == 0x0d:  # disconnect notice
+                    break
+                if packets[0] in StorageDataPoint.specs:
+                    count += self.count_storage_datapoints(packets)
+                if points and count >= points:
+                    break
+                yield packets
+            else:
+                # the device went silent after whole packets
+                complete = (
+                    packets is not None
+                    and self.discards['too_few_bytes'] == discards)
+                packets = None
+
+        # interrupted downloads are resumed from the partial file
+        if complete:
+            cache.finalize(key)
+            if packets is not None:
+                yield packets
+
     def get_storage_data(self, starttime=False,
-                         user_index=0x01, storage_segment=0x01):
+                         user_index=0x01, storage_segment=0x01, cache=None,
+                         points=None):
+        # points: expected number of datapoints, ends the download early
         if not starttime:
             starttime = datetime.datetime.now()
+        count = 0
         try:
-            self.connection.reset_input_buffer()
+            self.reset_input_buffer()
             self.send_command(  # start storage data
                 0xa6, [user_index, storage_segment])
-            for package_type, package in self.get_packages():
-                if package_type == 0x0f:
-                    if package[0] and package[1]:
-                        yield StorageDataPoint(
-                            package_type, package[0:2], time=starttime)
+            self.start_adaptive_timeout()
+            packets_list = self.get_storage_packets(
+                user_index, storage_segment, cache, points)
+            for package_type, package in self.get_packages(
+                    packets_list=packets_list):
+                for package in self.split_storage_package(
+                        package_type, package):
+                    datapoint = self.make_datapoint(
+                        StorageDataPoint, package_type, package, starttime)
+                    if datapoint:
+                        yield datapoint
                         starttime += self.storage_time_interval
-                    if package[2] and package[3]:
-                        yield StorageDataPoint(
-                            package_type, package[2:4], time=starttime)
-                        starttime += self.storage_time_interval
-                    if package[4] and package[5]:
-                        yield StorageDataPoint(
-                            package_type, package[4:6], time=starttime)
-                        starttime += self.storage_time_interval
-                else:
-                    yield StorageDataPoint(
-                        package_type, package, time=starttime)
-                    starttime += self.storage_time_interval
+                        count += 1
+                        if count == points:
+                            return
         except KeyboardInterrupt:
             pass
         finally:
+            self.stop_adaptive_timeout()
             self.send_command(0xa7)  # stop storage data
 
+    def download_storage_columns(self, starttime=False,
+                                 user_index=0x01, storage_segment=0x01,
+                                 cache=None, points=None):
+        # points: expected number of datapoints, ends the download early
+        if not starttime:
+            starttime = datetime.datetime.now()
+
+        # collect raw packets as runs of the same package type
+        runs = []  # [(package_type, packets length, bytearray), ...]
+        count = 0
+        try:
+            self.reset_input_buffer()
+            self.send_command(  # start storage data
+                0xa6, [user_index, storage_segment])
+            self.start_adaptive_timeout()
+            for packets in self.get_storage_packets(
+                    user_index, storage_segment, cache, points):
+                package_type = packets[0]
+                if package_type == 0x0d:  # disconnect notice
+                    _, package = self.decode_package(packets)
+                    if self.is_disconnect_notice(package_type, package):
+                        break
+                    continue
+                length = StorageDataPoint.specs.get(package_type)
+                if package_type == 0x0f:
+                    length *= 3
+                if length is None or len(packets) != length + 2:
+                    if not self.resync:
+                        raise ValueError("Invalid storage packets.")
+                    self.discards['invalid_package'] += 1
+                    continue
+                if not runs or runs[-1][0] != package_type:
+                    runs.append((package_type, length + 2, bytearray()))
+                runs[-1][2].extend(packets)
+                count += self.count_storage_datapoints(packets)
+                if points and count >= points:
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop_adaptive_timeout()
+            self.send_command(0xa7)  # stop storage data
+
+        # decode all packets at once
+        records = [np.zeros(0, dtype=StorageDataPoint.dtype)]
+        for package_type, length, data in runs:
+            packets = np.frombuffer(data, dtype=np.uint8).reshape(-1, length)
+            package_types, packages = self.decode_packages(packets)
+            records.append(
+                StorageDataPoint.decode_packages(package_types, packages))
+        records = np.concatenate(records)[:points]
+
+        # columns
+        columns = {name: records[name] for name in records.dtype.names}
+        columns['time'] = np.datetime64(starttime, 'us') + (
+            np.arange(len(records)) *
+            np.timedelta64(self.storage_time_interval))
+        return columns
+
+
+CMS50Dplus.cache_commands()
+
+
+class AsyncCMS50Dplus(CMS50Dplus):
+    def __init__(self, port='/dev/ttyUSB0', baudrate=115200, timeout=0.5,
+                 connect=True, resync=False):
+        self.loop = None
+        self.readable = None
+        self.keepalive_handle = None
+        self.closed = False
+        super().__init__(port, baudrate, timeout, connect, resync)
+
+    def connect(self):
+        super().connect()
+        self.connection.timeout = 0  # non-blocking reads on the event loop
+
+    def start_reading(self):
+        self.loop = asyncio.get_running_loop()
+        self.readable = asyncio.Event()
+        self.closed = False
+        self.loop.add_reader(self.connection.fileno(), self.on_readable)
+
+    def stop_reading(self):
+        if self.loop is not None and self.is_connected():
+            self.loop.remove_reader(self.connection.fileno())
+        self.loop = None
+
+    def on_readable(self):
+        try:
+            data = self.connection.read(self.read_size)
+        except serial.serialutil.SerialException:
+            data = b''
+        if not data:  # device disconnected
+            self.loop.remove_reader(self.connection.fileno())
+            self.closed = True
+        self.buffer.feed(data)
+        self.readable.set()
+
+    async def wait_buffer(self):
+        if self.closed:
+            return False
+        self.readable.clear()
+        try:
+            await asyncio.wait_for(self.readable.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self.closed
+
+    def start_keepalive(self):
+        self.keepalive_handle = self.loop.call_later(
+            max(self.keepalive_deadline - time.monotonic(), 0),
+            self.on_keepalive)
+
+    def stop_keepalive(self):
+        if self.keepalive_handle is not None:
+            self.keepalive_handle.cancel()
+            self.keepalive_handle = None
+
+    def on_keepalive(self):
+        self.send_keepalive()
+        self.start_keepalive()
+
+    async def get_packets(self, amount=0):
+        count = 0
+        while True:
+            packets = self.buffer.next_packets()
+            if packets is None:
+                if await self.wait_buffer():
+                    continue
+                packets = self.flush_packets(count, amount)
+                if packets:
+                    yield packets
+                break
+            yield packets
+            count += 1
+            if count == amount:
+                break
+
+    async def get_packages(self, amount=0):
+        async for packets in self.get_packets(amount):
+            package_type, package = self.decode_package(packets)
+            if self.is_disconnect_notice(package_type, package):
+                break
+            if package_type == 0x0d:  # dropped notice
+                continue
+            yield package_type, package
+
+    async def get_realtime_data(self, clock=None):
+        # clock: SessionClock to stamp datapoints with monotonic time
+        self.start_reading()
+        try:
+            self.reset_input_buffer()
+            self.send_command(0xa1)  # start realtime data
+            self.start_keepalive()
+            async for package_type, package in self.get_packages():
+                datapoint = self.make_datapoint(
+                    RealtimeDataPoint, package_type, package,
+                    clock and clock.now())
+                if datapoint:
+                    yield datapoint
+        finally:
+            self.stop_keepalive()
+            if self.is_connected():
+                self.send_command(0xa2)  # stop realtime data
+            self.stop_reading()
+
+    async def get_storage_data(self, starttime=False,
+                               user_index=0x01, storage_segment=0x01):
+        if not starttime:
+            starttime = datetime.datetime.now()
+        self.start_reading()
+        try:
+            self.reset_input_buffer()
+            self.send_command(  # start storage data
+                0xa6, [user_index, storage_segment])
+            async for package_type, package in self.get_packages():
+                for package in self.split_storage_package(
+                        package_type, package):
+                    datapoint = self.make_datapoint(
+                        StorageDataPoint, package_type, package, starttime)
+                    if datapoint:
+                        yield datapoint
+                        starttime += self.storage_time_interval
+        finally:
+            if self.is_connected():
+                self.send_command(0xa7)  # stop storage data
+            self.stop_reading()
+
+
+class CMS50DplusHub():
+    def __init__(self, timeout=0.5):
+        self.timeout = timeout
+        self.selector = selectors.DefaultSelector()
+        self.devices = {}  # {device_id: oximeter, ...}
+        self.consumers = {}  # {device_id: [consumer, ...], ...}
+        self.stats = {}  # {device_id: {statistic: value, ...}, ...}
+        self.started = False
+        self.running = False
+
+    def add_device(self, device_id, oximeter, consumer=None):
+        if device_id in self.devices:
+            raise ValueError("Device id already in use.")
+        self.devices[device_id] = oximeter
+        self.consumers[device_id] = []
+        self.stats[device_id] = {
+            'frames': 0,
+            'errors': 0,
+            'rate_frames': 0,
+            'rate_timestamp': time.monotonic(),
+        }
+        if consumer:
+            self.add_consumer(device_id, consumer)
+        self.selector.register(
+            oximeter.connection.fileno(), selectors.EVENT_READ, device_id)
+        if self.started:
+            self.start_device(device_id)
+
+    def remove_device(self, device_id):
+        oximeter = self.devices.pop(device_id)
+        self.consumers.pop(device_id)
+        self.stats.pop(device_id)
+        self.selector.unregister(oximeter.connection.fileno())
+        return oximeter
+
+    def add_consumer(self, device_id, consumer):
+        # consumer(device_id, datapoint) is called for every datapoint
+        self.consumers[device_id].append(consumer)
+
+    def start_device(self, device_id):
+        oximeter = self.devices[device_id]
+        oximeter.reset_input_buffer()
+        oximeter.send_command(0xa1)  # start realtime data
+
+    def stop_device(self, device_id):
+        oximeter = self.devices[device_id]
+        if oximeter.is_connected():
+            oximeter.send_command(0xa2)  # stop realtime data
+
+    def start(self):
+        for device_id in self.devices:
+            self.start_device(device_id)
+        self.started = True
+
+    def stop(self):
+        self.running = False
+        for device_id in self.devices:
+            self.stop_device(device_id)
+        self.started = False
+
+    def run(self):
+        if not self.started:
+            self.start()
+        self.running = True
+        try:
+            while self.running and self.devices:
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def poll(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        count = 0
+        for key, events in self.selector.select(timeout):
+            count += self.read_device(key.data)
+        for oximeter in self.devices.values():
+            oximeter.send_keepalive()
+        return count
+
+    def read_device(self, device_id):
+        oximeter = self.devices[device_id]
+        stats = self.stats[device_id]
+        try:
+            if not oximeter.read_buffer():
+                raise serial.serialutil.SerialException(
+                    "Device disconnected.")
+        except serial.serialutil.SerialException:
+            stats['errors'] += 1
+            self.remove_device(device_id)
+            return 0
+        count = 0
+        while True:
+            try:
+                packets = oximeter.buffer.next_packets()
+            except ValueError:  # resynchronize at the next packets
+                stats['errors'] += 1
+                oximeter.buffer.skip()
+                continue
+            if packets is None:
+                break
+            try:
+                package_type, package = oximeter.decode_package(packets)
+                if oximeter.is_disconnect_notice(package_type, package):
+                    self.remove_device(device_id)
+                    break
+                if package_type == 0x0d:  # dropped notice
+                    continue
+                datapoint = oximeter.make_datapoint(
+                    RealtimeDataPoint, package_type, package)
+            except ValueError:
+                stats['errors'] += 1
+                continue
+            if not datapoint:
+                continue
+            count += 1
+            for consumer in self.consumers[device_id]:
+                consumer(device_id, datapoint)
+        stats['frames'] += count
+        return count
+
+    def get_frame_rates(self):
+        # frames per second for each device since the last call
+        rates = {}
+        now = time.monotonic()
+        for device_id, stats in self.stats.items():
+            seconds = now - stats['rate_timestamp']
+            frames = stats['frames'] - stats['rate_frames']
+            rates[device_id] = seconds and frames / seconds or 0.0
+            stats['rate_frames'] = stats['frames']
+            stats['rate_timestamp'] = now
+        return rates
+
+
+def read_csv_data(filename):
+    with open(filename, 'r') as csvfile:
+        reader = csv.DictReader(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+        for row in reader:
+            if row['DataType'] == 'realtime':
+                DataPointClass = RealtimeDataPoint
+            elif row['DataType'] == 'storage':
+                DataPointClass = StorageDataPoint
+            else:
+                raise ValueError('Datatype unknown.')
+            package_type = int(row['PackageType'])
+            datapoint = DataPointClass(
+                package_type, [0] * DataPointClass.specs[package_type])
+            datapoint.set_csv_data(row)
+            yield datapoint
+
+
+def get_csv_class(filename):
+    # returns the datapoint class of files written by this module
+    with open(filename, 'r', newline='') as csvfile:
+        header = next(csv.reader(csvfile), None)
+    for DataPointClass in [RealtimeDataPoint, StorageDataPoint]:
+        if header == DataPointClass.get_csv_header():
+            return DataPointClass
+    return None
+
+
+def parse_csv_rows(header, rows, DataPointClass):
+    # parses the columns of rows written by this module with numpy,
+    # without datapoint objects. raises ValueError on other data.
+    keys = {attr[2]: attr[0] for attr in DataPointClass.attributes}
+    if rows and set(map(len, rows)) != {len(header)}:
+        raise ValueError("Invalid row length.")
+    columns = zip(*rows) if rows else [()] * len(header)
+    batch = {}
+    for key, column in zip(header, columns):
+        column = np.array(column, dtype=str)
+        name = keys[key]
+        if name == 'datatype':
+            if not (column == DataPointClass.datatype).all():
+                raise ValueError("Datatype mismatch.")
+        elif name == 'time':
+            # fixed format: YYYY-MM-DD HH:MM:SS[.ffffff]
+            lengths = np.char.str_len(column)
+            if not np.isin(lengths, [19, 26]).all():
+                raise ValueError("Invalid time format.")
+            batch['time'] = column.astype('datetime64[us]')
+        elif name in DataPointClass.dtype.names:
+            column = np.where(column == '-', '-1', column)  # no pi
+            batch[name] = column.astype(DataPointClass.dtype[name])
+    return batch
+
+
+def read_csv_columns(filename, DataPointClass, batch_size=65536):
+    # parses files written by this module in batches
+    with open(filename, 'r', newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        while True:
+            rows = list(itertools.islice(reader, batch_size))
+            if not rows:
+                break
+            yield parse_csv_rows(header, rows, DataPointClass)
+
+
+def load_csv_data(filename):
+    # returns a DataPointArray, foreign files take the slow path
+    DataPointClass = get_csv_class(filename)
+    if DataPointClass is not None:
+        points = DataPointArray(DataPointClass)
+        try:
+            for batch in read_csv_columns(filename, DataPointClass):
+                points.append(batch)
+            return points
+        except (ValueError, OverflowError):
+            pass
+    datapoints = read_csv_data(filename)
+    datapoint = next(datapoints, None)
+    if datapoint is None:
+        raise ValueError("No data.")
+    points = DataPointArray(datapoint.__class__)
+    points.extend(itertools.chain([datapoint], datapoints))
+    return points
+
+
+class ThreadedCsvWriter(threading.Thread):
+    # writes csv rows in batches on its own thread behind a bounded queue
+    def __init__(self, filename, header, queue_size=10000, batch_size=1000,
+                 drop=False, clock=None):
+        threading.Thread.__init__(self, daemon=True)
+        self.filename = filename
+        self.header = header
+        self.clock = clock  # SessionClock of monotonic datapoint times
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.drop = drop  # drop rows instead of waiting on a full queue
+        self.stopped = False
+        self.error = None
+        self.stats = {
+            'rows': 0,
+            'batches': 0,
+            'overruns': 0,  # rows put while the queue was full
+            'dropped': 0,
+        }
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        self.start()
+
+    def put(self, row):
+        if self.error is not None:
+            raise self.error
+        try:
+            self.queue.put_nowait(row)
+            return
+        except queue.Full:
+            self.stats['overruns'] += 1
+        if self.drop:
+            self.stats['dropped'] += 1
+            return
+        self.queue.put(row)
+
+    def write(self, datapoint):
+        self.put(datapoint.get_csv_data(self.clock))
+
+    def get_batch(self):
+        # waits for the first row, takes queued ones up to the batch size
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is None:  # end of rows
+            batch.pop()
+            self.stopped = True
+        return batch
+
+    def write_rows(self):
+        with open(self.filename, 'w') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(self.header)
+            while not self.stopped:
+                batch = self.get_batch()
+                writer.writerows(batch)
+                self.stats['rows'] += len(batch)
+                self.stats['batches'] += 1
+
+    def run(self):
+        try:
+            self.write_rows()
+        except Exception as e:
+            self.error = e
+            while not self.stopped:  # keep producers from blocking
+                self.get_batch()
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+
+class ThreadedSessionWriter(ThreadedCsvWriter):
+    # writes session file chunks on its own thread behind a bounded queue
+    def __init__(self, filename, DataPointClass, queue_size=10000,
+                 batch_size=1000, drop=False, clock=None, chunk_size=65536):
+        ThreadedCsvWriter.__init__(
+            self, filename, None, queue_size, batch_size, drop, clock)
+        self.session = SessionFile(
+            filename, DataPointClass, chunk_size, clock=clock)
+
+    def open(self):
+        self.session.open()
+        self.start()
+
+    def write(self, datapoint):
+        self.put(datapoint)
+
+    def write_rows(self):
+        try:
+            while not self.stopped:
+                batch = self.get_batch()
+                for datapoint in batch:
+                    self.session.write(datapoint)
+                self.stats['rows'] += len(batch)
+                self.stats['batches'] += 1
+        finally:
+            self.session.close()
+
+
+class Progress():
+    # progress output throttled to a few updates per second
+    def __init__(self, message="\rGot {0} measurements...", interval=0.25):
+        self.message = message
+        self.interval = interval
+        self.timestamp = 0
+
+    def update(self, count, force=False):
+        now = time.monotonic()
+        if not force and now - self.timestamp < self.interval:
+            return
+        self.timestamp = now
+        sys.stdout.write(self.format(count))
+        sys.stdout.flush()
+
+    def format(self, count):
+        return self.message.format(count)
+
+
+class ProgressBar(Progress):
+    # progress output with a bar of count / total
+    def __init__(self, total, message="\r[{bar}] {count}/{total} files",
+                 width=30, interval=0.25):
+        Progress.__init__(self, message, interval)
+        self.total = total
+        self.width = width
+
+    def format(self, count):
+        filled = self.width * count // max(self.total, 1)
+        return self.message.format(
+            bar='#' * filled + '-' * (self.width - filled),
+            count=count, total=self.total)
+
+
+class SegmentedWriter():
+    # writes datapoints into segments rotated by time or size, named
+    # '<name>-<starttime><extension>'. a segment is written under a hidden
+    # name and renamed when finished, '<name>.manifest.json' lists the
+    # finished ones with their time ranges.
+    def __init__(self, filename, DataPointClass, clock=None,
+                 segment_seconds=None, segment_size=None, drop=False,
+                 chunk_size=65536):
+        if not segment_seconds and not segment_size:
+            raise ValueError("Segment limit missing.")
+        self.directory, basename = os.path.split(filename)
+        self.name, self.extension = os.path.splitext(basename)
+        self.manifest_filename = os.path.join(
+            self.directory, self.name + '.manifest.json')
+        self.segment_pattern = re.compile(  # names given by start()
+            re.escape(self.name) + r'-\d{8}-\d{6}(-\d+)?'
+            + re.escape(self.extension) + '$')
+        self.DataPointClass = DataPointClass
+        self.clock = clock  # SessionClock of monotonic datapoint times
+        self.segment_seconds = segment_seconds
+        self.segment_size = segment_size  # bytes
+        self.drop = drop  # drop rows instead of waiting on a full queue
+        self.chunk_size = chunk_size  # rows of session file chunks
+        self.writer = None
+        self.segment = None  # manifest entry of the current segment
+        self.segment_end = None
+        self.manifest = {'segments': []}
+        self.stats = {
+            'rows': 0,
+            'segments': 0,
+            'overruns': 0,
+            'dropped': 0,
+            'errors': [],  # [(filename, error), ...] of unreadable segments
+        }
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_path(self, filename, hidden=False):
+        return os.path.join(self.directory, '.' * hidden + filename)
+
+    def open(self):
+        try:
+            with open(self.manifest_filename, 'r') as manifestfile:
+                self.manifest = json.load(manifestfile)
+        except FileNotFoundError:
+            pass
+        self.recover()
+
+    def close(self):
+        if self.writer is not None:
+            self.finish()
+
+    def recover(self):
+        # finishes the segments left by an interrupted dump, renamed ones
+        # missing in the manifest are added to it
+        listed = set(
+            segment['filename'] for segment in self.manifest['segments'])
+        for filename in sorted(os.listdir(self.directory or '.')):
+            hidden = filename.startswith('.')
+            if (not self.segment_pattern.match(filename[hidden:])
+                    or filename in listed):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                times = Recording(path, save_index=False).slice(
+                    columns=[])['time']
+            except (ValueError, OSError) as e:
+                # left in place, session files lose only a torn last chunk
+                self.stats['errors'].append((filename, str(e)))
+                continue
+            if not len(times):
+                os.remove(path)
+                continue
+            self.segment = {
+                'filename': filename[hidden:],
+                'starttime': str(times[0].item()),
+                'endtime': str(times[-1].item()),
+                'rows': len(times),
+            }
+            if hidden:
+                self.finish()
+            else:
+                self.add_segment()
+
+    def write(self, datapoint):
+        timestamp = datapoint.time
+        if self.clock is not None:
+            timestamp = self.clock.get_datetime(timestamp)
+        if self.writer is not None and self.is_full(timestamp):
+            self.finish()
+        if self.writer is None:
+            self.start(timestamp)
+        self.writer.write(datapoint)
+        self.segment['endtime'] = str(timestamp)
+        self.segment['rows'] += 1
+        self.stats['rows'] += 1
+
+    def is_full(self, timestamp):
+        if self.segment_seconds and timestamp >= self.segment_end:
+            return True
+        if self.segment_size and not self.segment['rows'] % 256:
+            path = self.get_path(self.segment['filename'], hidden=True)
+            return os.path.getsize(path) >= self.segment_size
+        return False
+
+    def start(self, timestamp):
+        if self.segment_seconds:
+            # segments end on multiples of the segment length in local time
+            length = datetime.timedelta(seconds=self.segment_seconds)
+            elapsed = timestamp - datetime.datetime(1970, 1, 1)
+            self.segment_end = timestamp - elapsed % length + length
+        filename = '{}-{:%Y%m%d-%H%M%S}'.format(self.name, timestamp)
+        suffix, count = '', 0
+        while any(os.path.exists(self.get_path(
+                filename + suffix + self.extension, hidden))
+                for hidden in [False, True]):
+            count += 1
+            suffix = '-{}'.format(count)
+        filename += suffix + self.extension
+        self.segment = {
+            'filename': filename,
+            'starttime': str(timestamp),
+            'endtime': str(timestamp),
+            'rows': 0,
+        }
+        self.writer = get_writer(
+            self.get_path(filename, hidden=True), self.DataPointClass,
+            self.clock, drop=self.drop, chunk_size=self.chunk_size)
+        self.writer.open()
+
+    def finish(self):
+        # renames the segment atomically and adds it to the manifest
+        if self.writer is not None:
+            self.writer.close()
+            for key in ['overruns', 'dropped']:
+                self.stats[key] += self.writer.stats.get(key, 0)
+            self.writer = None
+        filename = self.segment['filename']
+        os.replace(
+            self.get_path(filename, hidden=True), self.get_path(filename))
+        self.add_segment()
+
+    def add_segment(self):
+        self.manifest['segments'].append(self.segment)
+        self.segment = None
+        self.stats['segments'] += 1
+        temporary = self.get_path(
+            os.path.basename(self.manifest_filename), hidden=True)
+        with open(temporary, 'w') as manifestfile:
+            json.dump(self.manifest, manifestfile, indent=2)
+        os.replace(temporary, self.manifest_filename)
+
+
+class CMS50DplusEmulator(threading.Thread):
+    def __init__(self, realtime=None, storage=None, rate=60):
+        threading.Thread.__init__(self, daemon=True)
+        self.realtime = realtime  # iterable of RealtimeDataPoints
+        self.storage = storage  # iterable of StorageDataPoints
+        self.rate = rate  # frames per second, 0: as fast as possible
+        self.running = False
+        self.stream = None
+        self.stream_start = 0
+        self.stream_frames = 0
+        self.input = PacketBuffer(
+            resync=True, lengths={0x7d: 9}, padded=[0x7d])
+        self.output = bytearray()
+        self.stats = {
+            'frames': 0,
+            'bytes': 0,
+            'commands': 0,
+            'keepalives': 0,
+        }
+
+        # pseudo terminal
+        self.master, self.slave = os.openpty()
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    @staticmethod
+    def get_realtime_packets(datapoints):
+        for datapoint in datapoints:
+            yield CMS50Dplus.encode_package(
+                datapoint.package_type, datapoint.get_package())
+
+    @staticmethod
+    def get_storage_packets(datapoints):
+        # three datapoints without pi support share one package
+        package = []
+        for datapoint in datapoints:
+            if datapoint.package_type == 0x09:
+                yield CMS50Dplus.encode_package(0x09, datapoint.get_package())
+                continue
+            package += datapoint.get_package()
+            if len(package) == 6:
+                yield CMS50Dplus.encode_package(0x0f, package)
+                package = []
+        if package:
+            yield CMS50Dplus.encode_package(0x0f, package, padding=6)
+
+    def start_stream(self, packets):
+        self.stream = packets
+        self.stream_start = time.monotonic()
+        self.stream_frames = 0
+
+    def stop_stream(self):
+        self.stream = None
+        self.output.clear()
+
+    def handle_command(self, command, data):
+        self.stats['commands'] += 1
+        if command == 0xa1:  # start realtime data
+            realtime = self.realtime
+            if realtime is None:
+                realtime = (
+                    RealtimeDataPoint(0x01, test_package(7))
+                    for idx in itertools.count())
+            self.start_stream(self.get_realtime_packets(realtime))
+        elif command == 0xa6:  # start storage data
+            storage = self.storage
+            if storage is None:
+                storage = test_storage()
+            self.start_stream(self.get_storage_packets(storage))
+        elif command in [0xa2, 0xa7]:  # stop realtime/storage data
+            self.stop_stream()
+        elif command == 0xaf:  # keepalive
+            self.stats['keepalives'] += 1
+
+    def read_commands(self):
+        try:
+            self.input.feed(os.read(self.master, 1024))
+        except BlockingIOError:
+            return
+        while True:
+            packets = self.input.next_packets()
+            if packets is None:
+                break
+            package_type, package = CMS50Dplus.decode_package(packets)
+            if package_type == 0x7d:  # command
+                self.handle_command(package[0], package[1:])
+
+    def fill_output(self):
+        # queue the packets which are due
+        if self.stream is None:
+            return
+        if self.rate:
+            due = int((time.monotonic() - self.stream_start) * self.rate)
+            due -= self.stream_frames
+        else:
+            due = max(0, 4096 - len(self.output)) // 9
+        count = 0
+        for packets in itertools.islice(self.stream, due):
+            self.output += bytes(packets)
+            count += 1
+        self.stream_frames += count
+        self.stats['frames'] += count
+        if count < due:  # source exhausted
+            self.stream = None
+
+    def write_output(self):
+        try:
+            size = os.write(self.master, self.output)
+        except BlockingIOError:
+            return
+        del self.output[:size]
+        self.stats['bytes'] += size
+
+    def get_timeout(self):
+        if self.stream is None or not self.rate or self.output:
+            return 0.05
+        next_frame = self.stream_start + (self.stream_frames + 1) / self.rate
+        return min(max(next_frame - time.monotonic(), 0), 0.05)
+
+    def run(self):
+        self.running = True
+        while self.running:
+            self.fill_output()
+            writers = self.output and [self.master] or []
+            readable, writable, _ = select.select(
+                [self.master], writers, [], self.get_timeout())
+            if readable:
+                self.read_commands()
+            if writable:
+                self.write_output()
+
+    def stop(self):
+        self.running = False
+        if self.is_alive():
+            self.join()
+        os.close(self.slave)
+        os.close(self.master)
+
 
 class CMS50DplusGui():
     def __init__(self, port=False, testdata=False):
@@ -503,6 +3159,8 @@ class CMS50DplusGui():
         self.plot_xmin_window = datetime.timedelta(seconds=10)
         self.plot_xmax_margin = datetime.timedelta(seconds=1)
         self.date_format = "%d.%m.%Y %H:%M:%S"
+        self.filetypes = [
+            ('csv', '*.csv'), ('session', '*' + SessionFile.extension)]
         self.spO2_high = 100
         self.spO2_low = 90
         self.pulse_rate_high = 100
@@ -658,87 +3316,26 @@ class CMS50DplusGui():
         self.oximeter.disconnect()
 
     def load(self, event=None):
+        csvfile = filedialog.askopenfile(
+            filetypes=self.filetypes, defaultextension='csv')
+        if csvfile is None:
+            return
+        csvfile.close()
         try:
-            csvfile = filedialog.askopenfile(
-                filetypes=[('csv', '*.csv')], defaultextension='csv')
-            reader = csv.DictReader(csvfile, quoting=csv.QUOTE_NONNUMERIC)
-
-            # get first row
-            row = next(reader)
-
-            # get datatype
-            self.reset()
-            self.data['datatype'] = datatype = row['DataType']
-            self.data['package_type'] = package_type = row['PackageType']
-            if datatype == 'realtime':
-                DataPointClass = RealtimeDataPoint
-            elif datatype == 'storage':
-                DataPointClass = StorageDataPoint
+            if csvfile.name.endswith(SessionFile.extension):
+                points = SessionFile(csvfile.name).get_points()
             else:
-                raise ValueError('Datatype unknown.')
+                points = load_csv_data(csvfile.name)
 
             # get data
-            while row:
-
-                # create empty datapoint
-                datapoint = DataPointClass(
-                    package_type, [0] * DataPointClass.specs[package_type])
-
-                # set datapoint attributes
-                datapoint.set_csv_data(row)
-
-                # set collected data
-                self.data['count'] += 1
-                self.data['point'].append(datapoint)
-                self.data['time'].append(datapoint.time)
-                spO2 = np.nan
-                if datapoint.spO2:
-                    spO2 = datapoint.spO2
-                self.data['spO2'].append(spO2)
-                pulse_rate = np.nan
-                if datapoint.pulse_rate:
-                    pulse_rate = datapoint.pulse_rate
-                self.data['pulse_rate'].append(pulse_rate)
-
-                if self.data['datatype'] == 'realtime':
-                    pulse_waveform = np.nan
-                    if datapoint.pulse_waveform:
-                        pulse_waveform = datapoint.pulse_waveform
-                    self.data['pulse_waveform'].append(pulse_waveform)
-                    self.data['pulse_beep'].append(datapoint.pulse_beep)
-                    self.data['bar_graph'].append(datapoint.bar_graph)
-                    self.data['pi'].append(datapoint.pi)
-                    self.data['signal_strength'].append(
-                        datapoint.signal_strength)
-                    self.data['probe_error'].append(datapoint.probe_error)
-                    self.data['low_spO2'].append(datapoint.low_spO2)
-                    self.data['searching_too_long'].append(
-                        datapoint.searching_too_long)
-                    self.data['searching_pulse'].append(
-                        datapoint.searching_pulse)
-                    self.data['spO2_invalid'].append(datapoint.spO2_invalid)
-                    self.data['pulse_rate_invalid'].append(
-                        datapoint.pulse_rate_invalid)
-                    self.data['pi_valid'].append(datapoint.pi_valid)
-                    self.data['pi_invalid'].append(datapoint.pi_invalid)
-                    self.data['reserved'].append(datapoint.reserved)
-
-                # get next row
-                row = next(reader, False)
-
-            # calculate samplerate
-            start = self.data['time'][0]
-            end = self.data['time'][-1]
-            seconds = (end - start).total_seconds()
-            self.data['samplerate'] = len(self.data['time']) / seconds
+            self.reset(points.DataPointClass.datatype)
+            self.data['point'] = points
+            self.data['rate'].update_many(RateEstimator.get_seconds(
+                self.data['point'].get_column('time')))
 
             # plot data
             self.plot(samplerate=self.plot_samplerate, limit=False)
 
-        except TypeError as e:
-            if 'argument 1 must be an iterator' in str(e):
-                return
-            messagebox.showerror(title='Error:', message=e)
         except Exception as e:
             messagebox.showerror(title='Error:', message=e)
 
@@ -753,10 +3350,21 @@ class CMS50DplusGui():
             return
         try:
             csvfile = filedialog.asksaveasfile(
-                filetypes=[('csv', '*.csv')], defaultextension='csv')
+                filetypes=self.filetypes, defaultextension='csv')
+            if csvfile is not None and \
+                    csvfile.name.endswith(SessionFile.extension):
+                csvfile.close()
+                points = self.data['point']
+                with SessionFile(
+                        csvfile.name, points.DataPointClass,
+                        append=False) as session:
+                    session.append({
+                        name: points.get_column(name)
+                        for name in points.columns})
+                return
             writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
             writer.writerow(self.data['point'][0].get_csv_header())
-            for datapoint in self.data['point'][:self.data['count']]:
+            for datapoint in self.data['point']:
                 writer.writerow(datapoint.get_csv_data())
         except TypeError as e:
             if 'argument 1 must have a "write" method' in str(e):
@@ -875,7 +3483,7 @@ class CMS50DplusGui():
             ])
 
         # plot full data
-        self.plot(end=self.data['count'], samplerate=self.plot_samplerate)
+        self.plot(samplerate=self.plot_samplerate)
 
     def get_storage(self, event=None):
         self.reset('storage')
@@ -905,18 +3513,9 @@ class CMS50DplusGui():
             else:
                 datapoints = self.oximeter.get_storage_data(
                     starttime=self.starttime)
-            for datapoint in datapoints:
-                self.data['count'] += 1
-                self.data['point'].append(datapoint)
-                self.data['time'].append(datapoint.time)
-                spO2 = np.nan
-                if datapoint.spO2:
-                    spO2 = datapoint.spO2
-                self.data['spO2'].append(spO2)
-                pulse_rate = np.nan
-                if datapoint.pulse_rate:
-                    pulse_rate = datapoint.pulse_rate
-                self.data['pulse_rate'].append(pulse_rate)
+            self.data['point'].extend(datapoints)
+            self.data['rate'].update_many(RateEstimator.get_seconds(
+                self.data['point'].get_column('time')))
         except ValueError as e:
             messagebox.showerror(title='Error:', message=e)
             return
@@ -936,45 +3535,46 @@ class CMS50DplusGui():
             ])
 
     def reset(self, datatype=None):
+        DataPointClass = RealtimeDataPoint
+        if datatype == 'storage':
+            DataPointClass = StorageDataPoint
         self.data = {
             'datatype': datatype,
             'testdata': self.testdata,
-            'count': 0,
-            'samplerate': 0,
-            'point': [],
+            'rate': RateEstimator(),
+            'point': DataPointArray(DataPointClass),
         }
-        for DataPointClass in [StorageDataPoint, RealtimeDataPoint]:
-            for attr in DataPointClass.get_attribute_names():
-                self.data[attr] = []
 
     def plot(self, end=False, samplerate=False, cap=False, limit=True):
+        store = self.data['point']
+
         # pick end
         if not end:
-            end = len(self.data['time'])
+            end = len(store)
 
         # calculate steps from samplerate
+        rate = self.data['rate'].get_rate()
         step = 1
-        if samplerate and self.data['samplerate']:
-            step = int(self.data['samplerate'] / samplerate)
+        if samplerate and rate:
+            step = max(int(rate / samplerate), 1)
 
         # x axis
         start = 0
-        x = self.data['time'][:end:step]
-        if cap:
+        x = store.get_column('time', end, step)
+        if cap and rate:
             start = -int(
-                (self.plot_xmin_window.total_seconds() + 5) * samplerate)
+                (self.plot_xmin_window.total_seconds() + 5) * rate / step)
             x = x[start:]
 
-        # y axis
-        y_spO2 = self.data['spO2'][:end:step]
-        y_pulse_rate = self.data['pulse_rate'][:end:step]
-        y_pulse_waveform = self.data['pulse_waveform'][:end:step]
-        y_signal_strength = self.data['signal_strength'][:end:step]
-        if cap:
-            y_spO2 = y_spO2[start:]
-            y_pulse_rate = y_pulse_rate[start:]
-            y_pulse_waveform = y_pulse_waveform[start:]
-            y_signal_strength = y_signal_strength[start:]
+        # y axis, zeros are not plotted
+        y = {}
+        for name in ['spO2', 'pulse_rate', 'pulse_waveform',
+                     'signal_strength']:
+            if name not in store.columns:
+                continue
+            y[name] = store.get_column(name, end, step)[start:]
+            if name != 'signal_strength':
+                y[name] = np.where(y[name] == 0, np.nan, y[name])
 
         # clear plots
         self.ax_spO2.clear()
@@ -982,12 +3582,12 @@ class CMS50DplusGui():
         self.ax_other.clear()
 
         # view limits
-        if x:
-            xmin = x[0]
-            xmax = x[-1]
+        if len(x):
+            xmin = x[0].item()
+            xmax = x[-1].item()
             if limit:
-                xmin = x[-1] - self.plot_xmin_window
-                xmax = x[-1] + self.plot_xmax_margin
+                xmin = xmax - self.plot_xmin_window
+                xmax = xmax + self.plot_xmax_margin
             self.ax_spO2.set_xlim(xmin, xmax)
             self.ax_pulse_rate.set_xlim(xmin, xmax)
             self.ax_other.set_xlim(xmin, xmax)
@@ -1003,21 +3603,21 @@ class CMS50DplusGui():
 
         # plot main data
         self.ax_spO2.set_ylabel('SpO2 [%]', color='b')
-        self.ax_spO2.plot(x, y_spO2, color='b')
+        self.ax_spO2.plot(x, y['spO2'], color='b')
         self.ax_pulse_rate.set_ylabel('Pulse Rate [bpm]', color='r')
-        self.ax_pulse_rate.plot(x, y_pulse_rate, color='r')
+        self.ax_pulse_rate.plot(x, y['pulse_rate'], color='r')
 
         # plot other data
         legend = False
-        if y_signal_strength:
+        if len(x) and 'signal_strength' in y:
             legend = True
-            y_signal_strength_norm = [min(x, 8) / 8 for x in y_signal_strength]
+            y_signal_strength_norm = np.minimum(y['signal_strength'], 8) / 8
             self.ax_other.plot(
                 x, y_signal_strength_norm,
                 label="Signal Strength", color='0.5')
-        if y_pulse_waveform:
+        if len(x) and 'pulse_waveform' in y:
             legend = True
-            y_pulse_waveform_norm = [x / 127 for x in y_pulse_waveform]
+            y_pulse_waveform_norm = y['pulse_waveform'] / 127
             self.ax_other.plot(
                 x, y_pulse_waveform_norm,
                 label='Pulse Waveform', color='m')
@@ -1059,16 +3659,13 @@ class CMS50DplusGui():
             return
 
         # plot data
-        self.plot(
-            end=self.data['count'], samplerate=self.plot_samplerate, cap=True)
+        self.plot(samplerate=self.plot_samplerate, cap=True)
 
         # loop
         self.root.after(self.plot_refreshrate, self.plot_loop)
 
     def resize_plot(self):
-        self.plot(
-            end=self.data['count'], samplerate=self.plot_samplerate,
-            limit=False)
+        self.plot(samplerate=self.plot_samplerate, limit=False)
 
 
 class ThreadedRealtimeData(threading.Thread):
@@ -1078,6 +3675,15 @@ class ThreadedRealtimeData(threading.Thread):
         self.root = root
         self.oximeter = oximeter
         self.data = data
+        self.batch_interval = 0.05  # seconds between appends to the store
+        self.clock = None
+
+    def append(self, batch):
+        if batch:
+            columns = LazyRealtimeDataPoint.get_columns(batch, self.clock)
+            self.data['point'].append(columns)
+            self.data['rate'].update_many(
+                RateEstimator.get_seconds(columns['time']))
 
     def run(self):
         try:
@@ -1086,61 +3692,24 @@ class ThreadedRealtimeData(threading.Thread):
             if self.data['testdata']:
                 datapoints = test_realtime()
             else:
-                datapoints = self.oximeter.get_realtime_data()
+                self.clock = SessionClock()
+                datapoints = self.oximeter.get_realtime_data(
+                    lazy=True, clock=self.clock)
+            batch = []
+            timestamp = time.monotonic()
             for datapoint in datapoints:
 
                 # gracious thread end
                 if getattr(self.root, 'stop_thread', False):
                     break
 
-                # expand data if running out of allocated space
-                if len(self.data['time']) == self.data['count']:
-                    for key in self.data:
-                        if isinstance(self.data[key], list):
-                            self.data[key] += [0] * 100000
-
-                # add data
-                idx = self.data['count']
-                self.data['point'][idx] = datapoint
-                self.data['time'][idx] = datapoint.time
-
-                spO2 = np.nan
-                if datapoint.spO2:
-                    spO2 = datapoint.spO2
-                self.data['spO2'][idx] = spO2
-                pulse_rate = np.nan
-                if datapoint.pulse_rate:
-                    pulse_rate = datapoint.pulse_rate
-                self.data['pulse_rate'][idx] = pulse_rate
-                pulse_waveform = np.nan
-                if datapoint.pulse_waveform:
-                    pulse_waveform = datapoint.pulse_waveform
-                self.data['pulse_waveform'][idx] = pulse_waveform
-                self.data['pulse_beep'][idx] = datapoint.pulse_beep
-                self.data['bar_graph'][idx] = datapoint.bar_graph
-                self.data['pi'][idx] = datapoint.pi
-                self.data['signal_strength'][idx] = datapoint.signal_strength
-                self.data['probe_error'][idx] = datapoint.probe_error
-                self.data['low_spO2'][idx] = datapoint.low_spO2
-                self.data[
-                    'searching_too_long'][idx] = datapoint.searching_too_long
-                self.data['searching_pulse'][idx] = datapoint.searching_pulse
-                self.data['spO2_invalid'][idx] = datapoint.spO2_invalid
-                self.data[
-                    'pulse_rate_invalid'][idx] = datapoint.pulse_rate_invalid
-                self.data['pi_valid'][idx] = datapoint.pi_valid
-                self.data['pi_invalid'][idx] = datapoint.pi_invalid
-                self.data['reserved'][idx] = datapoint.reserved
-
-                # calculate samplerate
-                if self.data['count'] > 1:
-                    start = self.data['time'][0]
-                    end = self.data['time'][self.data['count']]
-                    seconds = (end - start).total_seconds()
-                    self.data['samplerate'] = self.data['count'] / seconds
-
-                # count datapoint
-                self.data['count'] += 1
+                # add data in batches
+                batch.append(datapoint)
+                if time.monotonic() - timestamp >= self.batch_interval:
+                    self.append(batch)
+                    batch = []
+                    timestamp = time.monotonic()
+            self.append(batch)
 
         except Exception as e:
             self.root.thread_exception = True
@@ -1152,14 +3721,14 @@ def start_gui(port, testdata=False):
     gui.start()
 
 
-def print_realtime_data(port, testdata=False):
+def print_realtime_data(port, testdata=False, resync=False):
     print("Saving live data...")
     print("Press CTRL-C / disconnect the device to terminate data collection.")
     if testdata:
         datapoints = test_realtime()
     else:
-        oximeter = CMS50Dplus(port)
-        datapoints = oximeter.get_realtime_data()
+        oximeter = CMS50Dplus(port, resync=resync)
+        datapoints = oximeter.get_realtime_data(lazy=True)
     try:
         for datapoint in datapoints:
             sys.stdout.write(
@@ -1178,50 +3747,177 @@ def print_realtime_data(port, testdata=False):
         pass
 
 
-def dump_realtime_data(port, filename, testdata=False):
+def get_writer(filename, DataPointClass, clock=None, segment_seconds=None,
+               segment_size=None, drop=False, chunk_size=65536):
+    # session file for *.cms50, csv otherwise, segmented if limited
+    # drop: drop rows instead of blocking the reader on a full queue
+    # chunk_size: rows of session file chunks, lost at most on a crash
+    if segment_seconds or segment_size:
+        return SegmentedWriter(
+            filename, DataPointClass, clock, segment_seconds, segment_size,
+            drop, chunk_size)
+    if filename.endswith(SessionFile.extension):
+        return ThreadedSessionWriter(
+            filename, DataPointClass, drop=drop, clock=clock,
+            chunk_size=chunk_size)
+    return ThreadedCsvWriter(
+        filename, DataPointClass.get_csv_header(), drop=drop, clock=clock)
+
+
+def print_writer_stats(writer):
+    if writer.stats.get('overruns'):
+        print("\nThe writer fell behind {} times, {} rows dropped.".format(
+            writer.stats['overruns'], writer.stats['dropped']))
+    for filename, error in writer.stats.get('errors', []):
+        print("\nCould not recover {}: {}".format(filename, error))
+
+
+def dump_realtime_data(port, filename, testdata=False, resync=False,
+                       segment_seconds=None, segment_size=None):
     print("Saving live data...")
     print("Press CTRL-C / disconnect the device to terminate data collection.")
+    clock = None
     if testdata:
         datapoints = test_realtime()
     else:
-        oximeter = CMS50Dplus(port)
-        datapoints = oximeter.get_realtime_data()
+        clock = SessionClock()
+        oximeter = CMS50Dplus(port, resync=resync)
+        datapoints = oximeter.get_realtime_data(clock=clock)
     measurements = 0
+    progress = Progress()
+    writer = get_writer(  # the device is not stalled by a slow disk
+        filename, RealtimeDataPoint, clock, segment_seconds, segment_size,
+        drop=True, chunk_size=4096)  # about a minute at 60 Hz
     try:
-        with open(filename, 'w') as csvfile:
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
-            writer.writerow(RealtimeDataPoint.get_csv_header())
+        with writer:
             for datapoint in datapoints:
-                writer.writerow(datapoint.get_csv_data())
+                writer.write(datapoint)
                 measurements += 1
-                sys.stdout.write(
-                    "\rGot {0} measurements...".format(measurements))
-                sys.stdout.flush()
+                progress.update(measurements)
     except KeyboardInterrupt:
         pass
+    progress.update(measurements, force=True)
+    print_writer_stats(writer)
 
 
-def dump_storage_data(port, filename, starttime, testdata=False):
+def capture_realtime_data(port, filename, testdata=False, resync=False):
+    print("Capturing live data...")
+    print("Press CTRL-C / disconnect the device to terminate data collection.")
+    measurements = 0
+    progress = Progress()
+    try:
+        with RawCapture(filename) as capture:
+            if testdata:
+                datapoints = test_realtime()
+            else:
+                oximeter = CMS50Dplus(port, resync=resync)
+                datapoints = oximeter.get_realtime_data(capture)
+            for datapoint in datapoints:
+                if testdata:
+                    capture.write(CMS50Dplus.encode_package(
+                        datapoint.package_type, datapoint.get_package()))
+                measurements += 1
+                progress.update(measurements)
+    except KeyboardInterrupt:
+        pass
+    progress.update(measurements, force=True)
+
+
+def dump_storage_data(port, filename, starttime, testdata=False,
+                      resync=False, cache=None, points=None):
+    # points: expected number of datapoints, the device does not report it
     print("Saving recorded data...")
     print("Please wait as the latest session is downloaded...")
     if testdata:
-        datapoints = test_storage(starttime=starttime)
+        datapoints = itertools.islice(
+            test_storage(starttime=starttime), points)
     else:
-        oximeter = CMS50Dplus(port)
-        datapoints = oximeter.get_storage_data(starttime)
+        oximeter = CMS50Dplus(port, resync=resync)
+        if cache is not None:
+            cache = StorageCache(cache)
+        datapoints = oximeter.get_storage_data(
+            starttime, cache=cache, points=points)
     measurements = 0
+    progress = Progress()
+    writer = get_writer(filename, StorageDataPoint)
     try:
-        with open(filename, 'w') as csvfile:
-            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
-            writer.writerow(StorageDataPoint.get_csv_header())
+        with writer:
             for datapoint in datapoints:
-                writer.writerow(datapoint.get_csv_data())
+                writer.write(datapoint)
                 measurements += 1
-                sys.stdout.write(
-                    "\rGot {0} measurements...".format(measurements))
-                sys.stdout.flush()
+                progress.update(measurements)
     except KeyboardInterrupt:
         pass
+    progress.update(measurements, force=True)
+    print_writer_stats(writer)
+
+
+def convert_data(directory, jobs=None):
+    print("Converting the CSV recordings in {}...".format(directory))
+    try:
+        stats = convert_directory(directory, jobs, progress=True)
+    except KeyboardInterrupt:
+        print("\nInterrupted, the next run resumes the conversion.")
+        return
+    print("\nConverted {} files, {} failed, {} up to date.".format(
+        stats['converted'], stats['failed'], stats['skipped']))
+    for source, error in stats['errors']:
+        print("{}: {}".format(source, error))
+
+
+def merge_data(filenames, filename):
+    print("Merging {} recordings...".format(len(filenames)))
+    stats = merge_recordings(
+        filenames, filename, gap_seconds=2,
+        progress=Progress("\rMerged {0} measurements..."))
+    print("\rMerged {} measurements, dropped {} duplicates, marked {} "
+          "gaps.".format(stats['rows'], stats['duplicates'], stats['gaps']))
+
+
+def emulate_device(filename=None):
+    realtime = storage = None
+    if filename:
+        if filename.endswith('.raw'):
+            datapoints = list(RawCapture(filename).get_datapoints())
+        elif filename.endswith(SessionFile.extension):
+            datapoints = list(SessionFile(filename).get_datapoints())
+        else:
+            datapoints = list(read_csv_data(filename))
+        if datapoints and datapoints[0].datatype == 'realtime':
+            realtime = itertools.cycle(datapoints)
+        else:
+            storage = datapoints
+    with CMS50DplusEmulator(realtime, storage) as emulator:
+        print("Emulating device on port {}".format(emulator.port))
+        print("Press CTRL-C to terminate the emulation.")
+        try:
+            while True:
+                time.sleep(1)
+                sys.stdout.write(
+                    "\rSent {0} frames...".format(emulator.stats['frames']))
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+
+
+def valid_rotation(s):
+    # returns {'segment_seconds': ...} or {'segment_size': ...}
+    units = {
+        '': ('segment_seconds', 1),
+        's': ('segment_seconds', 1),
+        'm': ('segment_seconds', 60),
+        'h': ('segment_seconds', 3600),
+        'd': ('segment_seconds', 86400),
+        'kb': ('segment_size', 2**10),
+        'mb': ('segment_size', 2**20),
+        'gb': ('segment_size', 2**30),
+    }
+    match = re.fullmatch(r'(\d+)\s*([a-z]*)', s.strip().lower())
+    if not match or match.group(2) not in units or not int(match.group(1)):
+        msg = "Not a valid rotation: '{0}'.".format(s)
+        raise argparse.ArgumentTypeError(msg)
+    key, factor = units[match.group(2)]
+    return {key: int(match.group(1)) * factor}
 
 
 def valid_datetime(s):
@@ -1247,15 +3943,60 @@ if __name__ == "__main__":
         default="realtime", help="Type of data.")
     parser.add_argument(
         "-f", "--filename",
-        help="Output CSV file.")
+        help="Output CSV file [session file for *.cms50, realtime: raw "
+             "capture for *.raw].")
     parser.add_argument(
         "-s", "--starttime", type=valid_datetime,
         help="Start time for storage mode data [any parsable format].")
     parser.add_argument(
         "-t", "--testdata", action='store_true',
         help="Use testdata, do not connect to the device.")
+    parser.add_argument(
+        "-r", "--resync", action='store_true',
+        help="Drop corrupt packets instead of aborting.")
+    parser.add_argument(
+        "--cache", nargs='?', const='', metavar='DIRECTORY',
+        help="Cache storage downloads [default: ~/.cache/cms50dplus7].")
+    parser.add_argument(
+        "--points", type=int, metavar='N',
+        help="Expected datapoints of a storage download, ends it early.")
+    parser.add_argument(
+        "--rotate", type=valid_rotation, default={}, metavar='LIMIT',
+        help="Rotate realtime dumps into segments [e.g. 1h, 30m, 100mb].")
+    parser.add_argument(
+        "-e", "--emulate", action='store_true',
+        help="Emulate a device on a pseudo terminal [source: FILENAME].")
+    parser.add_argument(
+        "-m", "--merge", nargs='+', metavar='SOURCE',
+        help="Merge recordings into FILENAME.")
+    parser.add_argument(
+        "--convert", metavar='DIRECTORY',
+        help="Convert the CSV recordings below DIRECTORY into session files.")
+    parser.add_argument(
+        "-j", "--jobs", type=int,
+        help="Parallel conversions [default: number of CPUs].")
     args = parser.parse_args()
 
+    # emulator
+    if args.emulate:
+        emulate_device(args.filename)
+        print("\nDone.")
+        exit()
+
+    # conversion
+    if args.convert:
+        convert_data(args.convert, args.jobs)
+        print("Done.")
+        exit()
+
+    # merge
+    if args.merge:
+        if not args.filename:
+            parser.error("The merge needs a FILENAME.")
+        merge_data(args.merge, args.filename)
+        print("Done.")
+        exit()
+
     # gui
     if not args.cli:
         start_gui(args.port, testdata=args.testdata)
@@ -1264,10 +4005,16 @@ if __name__ == "__main__":
     # cli
     if args.datatype == 'realtime':
         if not args.filename:
-            print_realtime_data(args.port, testdata=args.testdata)
+            print_realtime_data(
+                args.port, testdata=args.testdata, resync=args.resync)
+        elif args.filename.endswith('.raw'):
+            capture_realtime_data(
+                args.port, args.filename, testdata=args.testdata,
+                resync=args.resync)
         else:
             dump_realtime_data(
-                args.port, args.filename, testdata=args.testdata)
+                args.port, args.filename, testdata=args.testdata,
+                resync=args.resync, **args.rotate)
         print("\nDone.")
 
     if args.datatype == 'storage':
@@ -1277,5 +4024,6 @@ if __name__ == "__main__":
             args.filename = "{}-{}.csv".format(
                 args.datatype, args.starttime.strftime("%Y%m%d-%H%M%S"))
         dump_storage_data(
-            args.port, args.filename, args.starttime, testdata=args.testdata)
+            args.port, args.filename, args.starttime, testdata=args.testdata,
+            resync=args.resync, cache=args.cache, points=args.points)
         print("\nDone.")
@@ -1,19 +1,58 @@
 #!/usr/bin/env python
+import io
+import os
+import json
+import csv
+import itertools
+import threading
+import select
+import time
 import datetime
+import asyncio
+import tempfile
 import unittest
 from unittest.mock import patch
+import numpy as np
+import cms50dplus
 from cms50dplus import (
     test_package,
     CMS50Dplus,
+    AsyncCMS50Dplus,
+    CMS50DplusHub,
+    CMS50DplusEmulator,
+    PacketBuffer,
+    ThreadedCsvWriter,
+    ThreadedSessionWriter,
+    SegmentedWriter,
+    StorageCache,
+    RawCapture,
+    SessionFile,
+    CsvFile,
+    Recording,
+    merge_recordings,
+    convert_directory,
+    RateEstimator,
+    SessionClock,
+    DataPointArray,
+    read_csv_data,
+    load_csv_data,
     RealtimeDataPoint,
+    LazyRealtimeDataPoint,
     StorageDataPoint
 )
 
 
 def test_stream(byte_list):
     for byte in byte_list:
-        yield chr(byte)
-    yield ''
+        yield bytes([byte])
+    yield b''
+
+
+def test_chunks(byte_list, size):
+    byte_list = bytes(byte_list)
+    for idx in range(0, len(byte_list), size):
+        yield byte_list[idx:idx + size]
+    yield b''
 
 
 class CMS50DplusClassTests(unittest.TestCase):
@@ -187,6 +226,15 @@ class CMS50DplusClassTests(unittest.TestCase):
         for idx in range(1, 9):
             self.assertTrue(packets[idx] & 0x80)
 
+    def test_encode_command(self):
+        for command, data in CMS50Dplus.constant_commands:
+            packets = CMS50Dplus.encode_package(
+                0x7d, [command] + list(data), padding=7)
+            encoded = CMS50Dplus.encode_command(command, data)
+            self.assertIsInstance(encoded, bytes)
+            self.assertEqual(list(encoded), packets)
+            self.assertIs(CMS50Dplus.encode_command(command, data), encoded)
+
     def test_encode_package_decode_package(self):
         package_type = 0x00
         for run in range(0, 10):
@@ -195,6 +243,75 @@ class CMS50DplusClassTests(unittest.TestCase):
             _, decoded_package = CMS50Dplus.decode_package(packets)
             self.assertEqual(decoded_package, original_package)
 
+    def test_decode_packages(self):
+        packets_list = [
+            CMS50Dplus.encode_package(0x01, test_package(7))
+            for run in range(0, 100)]
+        package_types, packages = CMS50Dplus.decode_packages(packets_list)
+        for idx, packets in enumerate(packets_list):
+            package_type, package = CMS50Dplus.decode_package(packets)
+            self.assertEqual(package_types[idx], package_type)
+            self.assertEqual(packages[idx].tolist(), package)
+
+    def test_decode_packages_errors(self):
+        self.assertRaisesRegex(
+            ValueError, 'two dimensional',
+            CMS50Dplus.decode_packages, [0x00, 0x80, 0x80])
+        self.assertRaisesRegex(
+            ValueError, 'too short',
+            CMS50Dplus.decode_packages, [[0x00, 0x80]])
+        self.assertRaisesRegex(
+            ValueError, 'too long',
+            CMS50Dplus.decode_packages, [[0x00] + [0x80] * 9])
+        self.assertRaisesRegex(
+            ValueError, 'synchronization',
+            CMS50Dplus.decode_packages, [[0x00, 0x80, 0x80], [0x80] * 3])
+        self.assertRaisesRegex(
+            ValueError, 'synchronization',
+            CMS50Dplus.decode_packages, [[0x00, 0x80, 0x80], [0x00] * 3])
+
+
+class PacketBufferTests(unittest.TestCase):
+
+    def test_lengths(self):
+        packets = CMS50Dplus.encode_package(0x7d, test_package(7))
+        buffer = PacketBuffer()
+        buffer.feed(bytes(packets))
+        self.assertIsNone(buffer.next_packets())
+        buffer = PacketBuffer(lengths={0x7d: 9})
+        buffer.feed(bytes(packets))
+        self.assertEqual(buffer.next_packets(), packets)
+        self.assertEqual(len(buffer), 0)
+
+        # shorter packets are still terminated by the next one
+        buffer.feed(bytes(packets[:5] + packets))
+        self.assertEqual(buffer.next_packets(), packets[:5])
+        self.assertEqual(buffer.next_packets(), packets)
+
+    def test_lengths_excess(self):
+        packets = CMS50Dplus.encode_package(0x7d, test_package(7))
+        for data in [packets + [0x80] * 5 + packets, packets + [0x80]]:
+            buffer = PacketBuffer(lengths={0x7d: 9})
+            buffer.feed(bytes(data))
+            self.assertRaisesRegex(
+                ValueError, 'too many', buffer.next_packets)
+
+        # the excess is detected after complete packets were returned
+        buffer = PacketBuffer(lengths={0x7d: 9})
+        buffer.feed(bytes(packets))
+        self.assertEqual(buffer.next_packets(), packets)
+        buffer.feed(bytes([0x80] * 5 + packets))
+        self.assertRaisesRegex(ValueError, 'too many', buffer.next_packets)
+
+        # resync mode drops the packets with the excess
+        buffer = PacketBuffer(resync=True, lengths={0x7d: 9})
+        buffer.feed(bytes(packets))
+        self.assertIsNone(buffer.next_packets())
+        buffer.feed(bytes([0x80] * 5 + packets))
+        self.assertIsNone(buffer.next_packets())
+        self.assertEqual(buffer.discards['too_many_bytes'], 1)
+        self.assertEqual(buffer.flush(), packets)
+
 
 @patch('serial.Serial')
 class CMS50DplusInstanceTests(unittest.TestCase):
@@ -202,6 +319,7 @@ class CMS50DplusInstanceTests(unittest.TestCase):
     @patch('serial.Serial')
     def setUp(self, MockSerial):
         self.oxi = CMS50Dplus()
+        self.oxi.connection.in_waiting = 0
 
     def test_is_connected(self, MockSerial):
         # no connection
@@ -264,6 +382,12 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         self.oxi.send_bytes(byte_list)
         self.oxi.connection.write.assert_called_once_with(string)
 
+    def test_send_bytes_buffer(self, MockSerial):
+        data = bytes(range(0x00, 0xff))
+        for values in [data, bytearray(data), memoryview(data)]:
+            self.oxi.send_bytes(values)
+            self.oxi.connection.write.assert_called_with(values)
+
     def test_expect_byte(self, MockSerial):
         byte_list = range(0x00, 0xfe)
         self.oxi.connection.read.side_effect = test_stream(byte_list)
@@ -305,11 +429,33 @@ class CMS50DplusInstanceTests(unittest.TestCase):
             test_interval / self.oxi.keepalive_interval,
             delta=2)
 
+    @patch('time.monotonic')
+    def test_send_keepalive_stats(self, monotonic, MockSerial):
+        self.oxi.keepalive_timestamp = 0
+        self.oxi.keepalive_interval = datetime.timedelta(seconds=5)
+        monotonic.side_effect = [4, 6, 11, 16, 32]
+        for run in range(0, 5):
+            self.oxi.send_keepalive()
+        stats = self.oxi.keepalive_stats
+        self.assertEqual(stats['sent'], 4)
+        self.assertEqual(list(stats['times']), [6, 11, 16, 32])
+        self.assertEqual(stats['missed'], 1)
+        self.assertEqual(stats['max_delay'], 11)
+
+    def test_send_keepalive_jitter(self, MockSerial):
+        self.oxi.keepalive_jitter = 0.1
+        for run in range(0, 10):
+            self.oxi.schedule_keepalive()
+            delay = self.oxi.keepalive_deadline - self.oxi.keepalive_timestamp
+            self.assertGreaterEqual(delay, 4.9)
+            self.assertLessEqual(delay, 5)
+
     def test_get_packets_packet_length(self, MockSerial):
         # too few bytes
         data = CMS50Dplus.encode_package(0x00, test_package())
         for length in range(0, 3):
             byte_list = data[:length] * 10
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(byte_list)
             self.assertRaisesRegex(
                 ValueError, 'too few bytes', next, self.oxi.get_packets())
@@ -318,6 +464,7 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         data = CMS50Dplus.encode_package(0x00, test_package())
         for length in range(3, 10):
             byte_list = data[:length] * 10
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(byte_list)
             for packets in self.oxi.get_packets():
                 self.assertEqual(packets, byte_list[:length])
@@ -326,6 +473,7 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         data = CMS50Dplus.encode_package(0x00, test_package()) + [0x80] * 3
         for length in range(10, 13):
             byte_list = data[:length] * 10
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(byte_list)
             self.assertRaisesRegex(
                 ValueError, 'too many bytes', next, self.oxi.get_packets())
@@ -344,30 +492,141 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         # right amounts
         data = CMS50Dplus.encode_package(0x00, test_package()) * 10
         for amount in range(1, 11):
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(data)
             self.assertEqual(len(list(self.oxi.get_packets(amount))), amount)
 
         # too few packets
         for amount in range(11, 13):
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(data)
             self.assertRaisesRegex(
                 ValueError, 'too few packets',
                 list, self.oxi.get_packets(amount))
 
-    def test_get_packets_keepalive(self, MockSerial):
+    def test_get_packets_chunks(self, MockSerial):
+        packets_list = []
+        for packets in range(0, 10):
+            data = CMS50Dplus.encode_package(0x00, test_package())
+            packets_list.append(data)
+        byte_list = [byte for packets in packets_list for byte in packets]
+        for size in [1, 2, 5, 9, 13, 100]:
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_chunks(byte_list, size)
+            self.assertEqual(list(self.oxi.get_packets()), packets_list)
+
+    def test_get_packets_amount_keeps_buffer(self, MockSerial):
         data = CMS50Dplus.encode_package(0x00, test_package()) * 10
+        self.oxi.connection.read.side_effect = test_chunks(data, 100)
+        self.assertEqual(len(list(self.oxi.get_packets(3))), 3)
+        self.assertEqual(len(self.oxi.buffer), 7 * 9)
+        self.assertEqual(len(list(self.oxi.get_packets(7))), 7)
+
+    def test_get_packets_resync(self, MockSerial):
+        self.oxi.resync = self.oxi.buffer.resync = True
+        packets = CMS50Dplus.encode_package(0x01, test_package(7))
+        byte_list = (
+            [0x80, 0x81] + packets +             # unsynchronized
+            packets[:2] + packets +              # too few bytes
+            packets + [0x80] * 5 + packets +     # too many bytes
+            packets[:1])                         # too few bytes at the end
+        for size in [1, 4, 100]:
+            self.oxi.reset_input_buffer()
+            for key in self.oxi.discards:
+                self.oxi.discards[key] = 0
+            self.oxi.connection.read.side_effect = test_chunks(byte_list, size)
+            self.assertEqual(list(self.oxi.get_packets()), [packets] * 3)
+            self.assertEqual(self.oxi.discards, {
+                'unsynchronized': 1,
+                'too_few_bytes': 2,
+                'too_many_bytes': 1,
+                'invalid_package': 0,
+            })
+
+    def test_get_realtime_data_resync(self, MockSerial):
+        self.oxi.resync = self.oxi.buffer.resync = True
+        package = test_package(7)
+        data = (
+            CMS50Dplus.encode_package(0x01, package) * 5 +
+            CMS50Dplus.encode_package(0x02, package) +
+            CMS50Dplus.encode_package(0x01, package[:6]) +
+            CMS50Dplus.encode_package(0x01, package) * 5)
         self.oxi.connection.read.side_effect = test_stream(data)
-        self.oxi.keepalive_interval = datetime.timedelta(milliseconds=5)
+        datapoints = list(self.oxi.get_realtime_data())
+        self.assertEqual(len(datapoints), 10)
+        self.assertEqual(self.oxi.discards['invalid_package'], 2)
+
+    def test_disconnect_notice_resync(self, MockSerial):
+        data = (
+            CMS50Dplus.encode_package(0x01, test_package(7)) * 2 +
+            CMS50Dplus.encode_package(0x0d, [0x05]) +
+            CMS50Dplus.encode_package(0x01, test_package(7)) * 2)
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.assertRaises(ValueError, list, self.oxi.get_realtime_data())
+        self.oxi.resync = True
+        self.assertTrue(self.oxi.buffer.resync)
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.assertEqual(len(list(self.oxi.get_realtime_data())), 4)
+        self.assertEqual(self.oxi.discards['invalid_package'], 1)
 
-        start = datetime.datetime.now()
+    @patch('time.monotonic')
+    def test_get_packets_keepalive(self, monotonic, MockSerial):
+        data = CMS50Dplus.encode_package(0x00, test_package()) * 10
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.oxi.keepalive_timestamp = 0
+        self.oxi.keepalive_interval = datetime.timedelta(seconds=5)
+
+        # the clock advances by one second on each reading
+        monotonic.side_effect = itertools.count(1)
         list(self.oxi.get_packets())
-        end = datetime.datetime.now()
-        test_interval = end - start
 
-        self.assertAlmostEqual(
-            self.oxi.connection.write.call_count,
-            test_interval / self.oxi.keepalive_interval,
-            delta=2)
+        self.assertEqual(
+            self.oxi.connection.write.call_count, monotonic.call_count // 5)
+
+    def test_get_packets_packet_lengths(self, MockSerial):
+        # known packets are complete without the next ones
+        data = CMS50Dplus.encode_package(0x01, test_package(7))
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.assertEqual(next(self.oxi.get_packets()), data)
+
+        # padding of disconnect notices is dropped
+        self.oxi.reset_input_buffer()
+        data = CMS50Dplus.encode_package(0x0d, [0x00], padding=7) + data
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.assertEqual(
+            list(self.oxi.get_packets()), [data[:3], data[9:]])
+
+    def test_get_storage_data_points(self, MockSerial):
+        package = test_package(4)
+        data = CMS50Dplus.encode_package(0x09, package) * 10
+        self.oxi.connection.read.side_effect = test_stream(data)
+        datapoints = list(self.oxi.get_storage_data(points=4))
+        self.assertEqual(
+            [datapoint.get_package() for datapoint in datapoints],
+            [package] * 4)
+        self.oxi.reset_input_buffer()
+        data = CMS50Dplus.encode_package(0x0f, test_package(6)) * 10
+        self.oxi.connection.read.side_effect = test_chunks(data, 8)
+        columns = self.oxi.download_storage_columns(points=4)
+        self.assertEqual(len(columns['time']), 4)
+
+        # empty datapoints do not count
+        self.oxi.reset_input_buffer()
+        package = [0x60, 0x50, 0x00, 0x00, 0x61, 0x51]
+        data = CMS50Dplus.encode_package(0x0f, package) * 10
+        self.oxi.connection.read.side_effect = test_chunks(data, 8)
+        columns = self.oxi.download_storage_columns(points=5)
+        self.assertEqual(columns['spO2'].tolist(), [0x60, 0x61] * 2 + [0x60])
+
+    def test_adaptive_timeout(self, MockSerial):
+        self.oxi.connection.timeout = self.oxi.timeout
+        data = CMS50Dplus.encode_package(0x09, test_package(4)) * 10
+        self.oxi.connection.read.side_effect = test_stream(data)
+        datapoints = self.oxi.get_storage_data()
+        next(datapoints)
+        self.assertEqual(self.oxi.connection.timeout, self.oxi.min_timeout)
+        list(datapoints)
+        self.assertEqual(self.oxi.connection.timeout, self.oxi.timeout)
 
     def test_get_packages_yields(self, MockSerial):
         package_type = 0x01
@@ -383,6 +642,7 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         package = test_package()
         data = CMS50Dplus.encode_package(package_type, package) * 10
         for amount in range(1, 11):
+            self.oxi.reset_input_buffer()
             self.oxi.connection.read.side_effect = test_stream(data)
             self.assertEqual(len(list(self.oxi.get_packages(amount))), amount)
 
@@ -408,6 +668,1181 @@ class CMS50DplusInstanceTests(unittest.TestCase):
         for storage_data_point in self.oxi.get_storage_data():
             self.assertIsInstance(storage_data_point, StorageDataPoint)
 
+    def test_get_storage_data_cache(self, MockSerial):
+        data = []
+        for run in range(0, 20):
+            data += CMS50Dplus.encode_package(0x09, test_package(4))
+        data += CMS50Dplus.encode_package(0x0d, [0x00])  # end notice
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StorageCache(directory, fingerprint_packets=4)
+
+            # interrupted download
+            self.oxi.connection.read.side_effect = test_stream(data)
+            for idx, datapoint in enumerate(
+                    self.oxi.get_storage_data(cache=cache)):
+                if idx == 9:
+                    break
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertTrue(os.listdir(directory)[0].endswith('.part'))
+
+            # resumed download
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(data)
+            packages = [
+                dp.get_package()
+                for dp in self.oxi.get_storage_data(cache=cache)]
+            self.assertEqual(len(packages), 20)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertTrue(os.listdir(directory)[0].endswith('.raw'))
+
+            # cached download
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(data[:4 * 6])
+            self.assertEqual([
+                dp.get_package()
+                for dp in self.oxi.get_storage_data(cache=cache)], packages)
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(data[:4 * 6])
+            columns = self.oxi.download_storage_columns(cache=cache)
+            self.assertEqual(len(columns['spO2']), 20)
+
+            # other session
+            self.oxi.reset_input_buffer()
+            other = CMS50Dplus.encode_package(0x09, test_package(4)) * 5
+            self.oxi.connection.read.side_effect = test_stream(other)
+            self.assertEqual(
+                len(list(self.oxi.get_storage_data(cache=cache))), 5)
+            self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_get_storage_data_cache_partial(self, MockSerial):
+        data = []
+        for run in range(0, 20):
+            data += CMS50Dplus.encode_package(0x0f, [0x60, 0x50] * 3)
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StorageCache(directory, fingerprint_packets=4)
+
+            # the download is interrupted
+            self.oxi.connection.read.side_effect = [
+                bytes([byte]) for byte in data[:8 * 12]] + [
+                KeyboardInterrupt()]
+            self.assertEqual(
+                len(list(self.oxi.get_storage_data(cache=cache))), 36)
+            self.assertTrue(os.listdir(directory)[0].endswith('.part'))
+
+            # the device stops in the middle of a packet
+            self.oxi.resync = True
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(
+                data[:8 * 16 + 3])
+            self.assertEqual(
+                len(list(self.oxi.get_storage_data(cache=cache))), 48)
+            self.assertEqual(self.oxi.discards['too_few_bytes'], 1)
+            self.assertTrue(os.listdir(directory)[0].endswith('.part'))
+            self.oxi.resync = False
+
+            # the expected number of datapoints completes the download
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(data)
+            self.assertEqual(len(list(self.oxi.get_storage_data(
+                cache=cache, points=48))), 48)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertTrue(os.listdir(directory)[0].endswith('.raw'))
+            self.oxi.reset_input_buffer()
+            self.oxi.connection.read.side_effect = test_stream(data[:8 * 4])
+            columns = self.oxi.download_storage_columns(cache=cache)
+            self.assertEqual(len(columns['spO2']), 48)
+
+    def test_download_storage_columns(self, MockSerial):
+        data = []
+        for run in range(0, 10):
+            data += CMS50Dplus.encode_package(0x0f, test_package(6))
+        for run in range(0, 10):
+            data += CMS50Dplus.encode_package(0x09, test_package(4))
+        starttime = datetime.datetime(2020, 1, 1)
+        self.oxi.connection.read.side_effect = test_stream(data)
+        datapoints = list(self.oxi.get_storage_data(starttime))
+        self.oxi.reset_input_buffer()
+        self.oxi.connection.read.side_effect = test_chunks(data, 64)
+        columns = self.oxi.download_storage_columns(starttime)
+        self.assertEqual(len(columns['time']), len(datapoints))
+        for idx, dp in enumerate(datapoints):
+            self.assertEqual(columns['time'][idx].item(), dp.time)
+            for name in ['spO2', 'pulse_rate', 'spO2_invalid', 'pi_support']:
+                self.assertEqual(columns[name][idx], getattr(dp, name))
+            if dp.pi_support:
+                self.assertEqual(columns['pi'][idx], dp.pi)
+                self.assertEqual(columns['pi_invalid'][idx], dp.pi_invalid)
+
+    def test_download_storage_columns_invalid(self, MockSerial):
+        data = CMS50Dplus.encode_package(0x0f, test_package(6)) * 3
+        data += CMS50Dplus.encode_package(0x0f, test_package(4))
+        self.oxi.connection.read.side_effect = test_stream(
+            data + CMS50Dplus.encode_package(0x0f, test_package(6)))
+        self.assertRaisesRegex(
+            ValueError, 'Invalid storage packets',
+            self.oxi.download_storage_columns)
+
+        # a short packet at the end of the stream
+        self.oxi.reset_input_buffer()
+        self.oxi.connection.read.side_effect = test_stream(data)
+        self.assertRaisesRegex(
+            ValueError, 'too few bytes', self.oxi.download_storage_columns)
+
+
+class RateEstimatorTests(unittest.TestCase):
+
+    def setUp(self):
+        random = np.random.default_rng(0)
+        intervals = 1 / 60 + random.uniform(-0.002, 0.002, 3000)
+        intervals[1000] = 2  # gap
+        self.timestamps = 1600000000 + np.cumsum(intervals)
+
+    def test_update(self):
+        estimator = RateEstimator()
+        for timestamp in self.timestamps:
+            estimator.update(timestamp)
+        self.assertEqual(estimator.count, 3000)
+        self.assertAlmostEqual(estimator.get_rate(), 60, delta=1)
+        self.assertAlmostEqual(estimator.get_window_rate(), 60, delta=0.5)
+        self.assertEqual(estimator.gap_count, 1)
+        start, seconds = estimator.gaps[0]
+        self.assertAlmostEqual(start, self.timestamps[999])
+        self.assertAlmostEqual(seconds, 2)
+        jitter = estimator.get_jitter()
+        self.assertLess(jitter[50], jitter[95])
+        self.assertLess(jitter[99], 0.002)
+
+    def test_update_many(self):
+        estimator = RateEstimator()
+        for timestamp in self.timestamps:
+            estimator.update(timestamp)
+        batched = RateEstimator()
+        for idx in range(0, 3000, 500):
+            batched.update_many(self.timestamps[idx:idx + 500])
+        self.assertEqual(batched.count, estimator.count)
+        self.assertEqual(batched.gap_count, estimator.gap_count)
+        self.assertAlmostEqual(
+            batched.get_rate(), estimator.get_rate(), places=6)
+        self.assertAlmostEqual(
+            batched.get_window_rate(), estimator.get_window_rate(), places=6)
+
+    def test_get_seconds(self):
+        times = np.array(['2020-01-01T00:00:00', '2020-01-01T00:00:01.5'],
+                         dtype='datetime64[us]')
+        self.assertEqual(
+            np.diff(RateEstimator.get_seconds(times)).tolist(), [1.5])
+
+
+class SessionClockTests(unittest.TestCase):
+
+    def test_datetime(self):
+        clock = SessionClock()
+        before = datetime.datetime.now()
+        timestamp = clock.now()
+        after = datetime.datetime.now()
+        self.assertIsInstance(timestamp, int)
+        delta = datetime.timedelta(milliseconds=1)
+        self.assertGreaterEqual(clock.get_datetime(timestamp), before - delta)
+        self.assertLessEqual(clock.get_datetime(timestamp), after + delta)
+        self.assertEqual(
+            clock.get_datetime(timestamp + 1500000),
+            clock.get_datetime(timestamp) + datetime.timedelta(
+                microseconds=1500))
+        times = [timestamp + idx * 16666667 for idx in range(0, 100)]
+        self.assertEqual(
+            clock.get_datetimes(times).tolist(),
+            [clock.get_datetime(timestamp) for timestamp in times])
+        self.assertAlmostEqual(
+            clock.get_epoch_nanoseconds(timestamp),
+            SessionClock.to_nanoseconds(clock.get_datetime(timestamp)),
+            delta=2000)
+
+    @patch('serial.Serial')
+    def test_get_realtime_data(self, MockSerial):
+        oxi = CMS50Dplus()
+        oxi.connection.in_waiting = 0
+        data = []
+        for run in range(0, 10):
+            data += CMS50Dplus.encode_package(0x01, test_package(7))
+        oxi.connection.read.side_effect = test_stream(data)
+        clock = SessionClock()
+        datapoints = list(oxi.get_realtime_data(clock=clock))
+        times = [datapoint.time for datapoint in datapoints]
+        self.assertEqual(times, sorted(times))
+        self.assertIsInstance(times[0], int)
+        self.assertEqual(
+            datapoints[0].get_csv_data(clock)[0], clock.get_datetime(times[0]))
+        array = DataPointArray(RealtimeDataPoint)
+        array.extend(datapoints, clock=clock)
+        self.assertEqual(
+            array[-1].time, clock.get_datetime(times[-1]))
+
+
+class RawCaptureTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'capture.raw')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write(self):
+        packets_list = [
+            CMS50Dplus.encode_package(0x01, test_package(7)),
+            CMS50Dplus.encode_package(0x0f, test_package(6)),
+            CMS50Dplus.encode_package(0x0d, [0x00]),
+        ]
+        with RawCapture(self.filename) as capture:
+            for idx, packets in enumerate(packets_list):
+                capture.write(packets, idx)
+        self.assertEqual(len(capture), 3)
+        self.assertEqual(
+            os.path.getsize(self.filename),
+            len(RawCapture.magic) + 3 * RawCapture.dtype.itemsize)
+        for frame, packets in zip(capture.get_frames(), packets_list):
+            self.assertEqual(
+                frame['packets'][:frame['length']].tolist(), packets)
+
+        # append
+        with RawCapture(self.filename) as capture:
+            capture.write(packets_list[0], 3)
+        self.assertEqual(len(capture), 4)
+
+        # torn last record
+        with open(self.filename, 'ab') as capturefile:
+            capturefile.write(b'\x00' * 5)
+        self.assertEqual(len(RawCapture(self.filename)), 4)
+        with RawCapture(self.filename) as capture:
+            capture.write(packets_list[0], 4)
+        self.assertEqual(
+            capture.get_frames()['time'].tolist(), [0, 1, 2, 3, 4])
+
+        # invalid file
+        with open(self.filename, 'wb') as capturefile:
+            capturefile.write(b'Time,SpO2\n')
+        self.assertRaisesRegex(
+            ValueError, 'Invalid capture file', RawCapture, self.filename)
+
+    def test_find(self):
+        with RawCapture(self.filename, index_interval=16) as capture:
+            for idx in range(0, 1000):
+                capture.write(test_package(9), idx * 10)
+        self.assertEqual(len(capture.index), 63)
+        self.assertEqual(capture.find(-1), 0)
+        self.assertEqual(capture.find(0), 0)
+        self.assertEqual(capture.find(5), 1)
+        self.assertEqual(capture.find(160), 16)
+        self.assertEqual(capture.find(9990), 999)
+        self.assertEqual(capture.find(9991), 1000)
+        self.assertEqual(len(capture.get_frames(155, 3205)), 305)
+
+        # without index
+        os.remove(capture.index_filename)
+        capture.load()
+        self.assertEqual(capture.find(3205), 321)
+
+    def test_get_datapoints(self):
+        starttime = datetime.datetime(2020, 1, 1, 12, 0, 0, 5)
+        interval = datetime.timedelta(microseconds=16667)
+        packages = [test_package(7) for idx in range(0, 100)]
+        with RawCapture(self.filename) as capture:
+            for idx, package in enumerate(packages):
+                capture.write(
+                    CMS50Dplus.encode_package(0x01, package),
+                    starttime + idx * interval)
+            capture.write(CMS50Dplus.encode_package(0x0d, [0x00]))
+        datapoints = list(capture.get_datapoints())
+        self.assertEqual(
+            [datapoint.get_package() for datapoint in datapoints], packages)
+        self.assertEqual(datapoints[10].time, starttime + 10 * interval)
+        datapoints = list(capture.get_datapoints(
+            starttime + 10 * interval, starttime + 20 * interval))
+        self.assertEqual(len(datapoints), 10)
+
+        # columns
+        columns = capture.get_columns()
+        self.assertEqual(len(columns['time']), 100)
+        self.assertEqual(
+            columns['time'][10].item(), starttime + 10 * interval)
+        self.assertEqual(
+            columns['pulse_rate'].tolist(),
+            [package[3] for package in packages])
+
+    def test_storage(self):
+        packages = [[0x60, 0x50, 0x61, 0x51, 0x00, 0x00], [0x62, 0x52] * 3]
+        with RawCapture(self.filename) as capture:
+            for idx, package in enumerate(packages):
+                capture.write(CMS50Dplus.encode_package(0x0f, package), idx)
+            capture.write(CMS50Dplus.encode_package(0x09, [0x63] * 4), 2)
+        recording = Recording(self.filename)
+        self.assertEqual(recording.DataPointClass, StorageDataPoint)
+        datapoints = list(capture.get_datapoints())
+        self.assertEqual(len(datapoints), 6)
+        columns = recording.slice()
+        self.assertEqual(
+            columns['spO2'].tolist(), [dp.spO2 for dp in datapoints])
+        self.assertEqual(
+            columns['pi_support'].tolist(),
+            [dp.pi_support for dp in datapoints])
+        self.assertEqual(
+            columns['time'].tolist(), [dp.time for dp in datapoints])
+
+    @patch('serial.Serial')
+    def test_get_realtime_data(self, MockSerial):
+        oxi = CMS50Dplus()
+        oxi.connection.in_waiting = 0
+        data = []
+        for run in range(0, 10):
+            data += CMS50Dplus.encode_package(0x01, test_package(7))
+        oxi.connection.read.side_effect = test_stream(data)
+        with RawCapture(self.filename) as capture:
+            datapoints = list(oxi.get_realtime_data(capture))
+        self.assertEqual(
+            [dp.get_package() for dp in capture.get_datapoints()],
+            [dp.get_package() for dp in datapoints])
+
+
+class ThreadedCsvWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'data.csv')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def read_rows(self):
+        with open(self.filename) as csvfile:
+            return list(csv.reader(csvfile, quoting=csv.QUOTE_NONNUMERIC))
+
+    def test_write(self):
+        header = RealtimeDataPoint.get_csv_header()
+        rows = [
+            RealtimeDataPoint(0x01, test_package(7)).get_csv_data()
+            for idx in range(0, 5000)]
+        with ThreadedCsvWriter(self.filename, header, batch_size=100) \
+                as writer:
+            for row in rows:
+                writer.put(row)
+        self.assertEqual(writer.stats['rows'], 5000)
+        self.assertGreaterEqual(writer.stats['batches'], 50)
+        self.assertEqual(writer.stats['dropped'], 0)
+        expected = io.StringIO()
+        csv.writer(expected, quoting=csv.QUOTE_NONNUMERIC).writerows(
+            [header] + rows)
+        with open(self.filename, newline='') as csvfile:
+            self.assertEqual(csvfile.read(), expected.getvalue())
+
+    def test_overruns(self):
+        writer = ThreadedCsvWriter(
+            self.filename, ['value'], queue_size=2, drop=True)
+        for idx in range(0, 5):
+            writer.put([idx])
+        self.assertEqual(writer.stats['overruns'], 3)
+        self.assertEqual(writer.stats['dropped'], 3)
+        with writer:
+            pass
+        self.assertEqual(writer.stats['rows'], 2)
+        self.assertEqual(self.read_rows(), [['value'], [0], [1]])
+
+    def test_get_writer_drop(self):
+        writer = cms50dplus.get_writer(
+            self.filename, RealtimeDataPoint, drop=True)
+        self.assertTrue(writer.drop)
+        datapoint = RealtimeDataPoint(
+            0x01, test_package(7), datetime.datetime(2020, 1, 1))
+        with cms50dplus.get_writer(
+                self.filename, RealtimeDataPoint, segment_seconds=60,
+                drop=True) as writer:
+            writer.write(datapoint)
+            self.assertTrue(writer.writer.drop)
+
+    def test_error(self):
+        filename = os.path.join(self.directory.name, 'missing', 'data.csv')
+        writer = ThreadedCsvWriter(filename, ['value'], queue_size=2)
+        with self.assertRaises(FileNotFoundError):
+            with writer:
+                for idx in range(0, 10):
+                    writer.put([idx])
+                    time.sleep(0.01)
+
+
+class SessionFileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'session.cms50')
+        start = datetime.datetime(2020, 1, 1)
+        self.datapoints = [
+            RealtimeDataPoint(
+                0x01, test_package(7),
+                start + datetime.timedelta(seconds=idx / 60))
+            for idx in range(0, 1000)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_write(self):
+        for compression in ['zlib', 'lzma', 'none']:
+            filename = os.path.join(
+                self.directory.name, compression + '.cms50')
+            with SessionFile(filename, RealtimeDataPoint,
+                             chunk_size=300, compression=compression) \
+                    as session:
+                for dp in self.datapoints:
+                    session.write(dp)
+            self.assertEqual(len(session), 1000)
+            self.assertEqual(
+                [chunk[0] for chunk in session.chunks], [300, 300, 300, 100])
+            session = SessionFile(filename)
+            self.assertEqual(session.DataPointClass, RealtimeDataPoint)
+            self.assertEqual(session.compression, compression)
+            for dp, other in zip(self.datapoints, session.get_datapoints()):
+                self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+
+    def test_append(self):
+        points = DataPointArray(RealtimeDataPoint)
+        points.extend(self.datapoints)
+        columns = {name: points.get_column(name) for name in points.columns}
+        with SessionFile(self.filename, RealtimeDataPoint,
+                         chunk_size=300) as session:
+            session.append(columns)
+            self.assertEqual(len(session), 900)  # full chunks only
+
+            # readable before close
+            other = SessionFile(self.filename)
+            self.assertEqual(len(other), 900)
+        with SessionFile(self.filename, chunk_size=300) as session:
+            session.write(self.datapoints[0])
+        self.assertEqual(len(session), 1001)
+        self.assertEqual(
+            session.get_points().get_column('pulse_waveform')[-2:].tolist(),
+            [self.datapoints[-1].pulse_waveform,
+             self.datapoints[0].pulse_waveform])
+        self.assertRaises(
+            ValueError, SessionFile, self.filename, StorageDataPoint)
+
+        # overwrite
+        with SessionFile(self.filename, StorageDataPoint,
+                         append=False) as session:
+            session.write(StorageDataPoint(0x0f, [0x60, 0x50]))
+        self.assertEqual(len(session), 1)
+        self.assertEqual(session.DataPointClass, StorageDataPoint)
+
+    def test_interrupted(self):
+        with SessionFile(self.filename, RealtimeDataPoint,
+                         chunk_size=300) as session:
+            for dp in self.datapoints[:900]:
+                session.write(dp)
+            with open(self.filename, 'rb') as sessionfile:
+                data = sessionfile.read()
+            for dp in self.datapoints[900:]:
+                session.write(dp)
+
+        # chunks and their entries are appended
+        with open(self.filename, 'rb') as sessionfile:
+            tail = sessionfile.read()[len(data):]
+        self.assertTrue(tail)
+
+        # a torn last chunk leaves the chunks before
+        for size in [1, SessionFile.trailer.size, len(tail) - 1]:
+            with open(self.filename, 'wb') as sessionfile:
+                sessionfile.write(data + tail[:size])
+            self.assertEqual(len(SessionFile(self.filename)), 900)
+        with SessionFile(self.filename, chunk_size=300) as session:
+            for dp in self.datapoints[900:]:
+                session.write(dp)
+        self.assertEqual(
+            [dp.get_csv_data() for dp in session.get_datapoints()],
+            [dp.get_csv_data() for dp in self.datapoints])
+
+        # torn header
+        with open(self.filename, 'wb') as sessionfile:
+            sessionfile.write(
+                data[:len(SessionFile.magic) + SessionFile.trailer.size + 1])
+        self.assertRaises(ValueError, SessionFile, self.filename)
+
+    def test_threaded(self):
+        writer = cms50dplus.get_writer(
+            self.filename, RealtimeDataPoint, drop=True, chunk_size=300)
+        self.assertIsInstance(writer, ThreadedSessionWriter)
+        threads = []
+        write_chunk = writer.session.write_chunk
+
+        def record_thread(columns):
+            threads.append(threading.current_thread())
+            write_chunk(columns)
+        writer.session.write_chunk = record_thread
+        with writer:
+            for dp in self.datapoints:
+                writer.write(dp)
+        self.assertEqual(writer.stats['rows'], 1000)
+        self.assertEqual(threads, [writer] * 4)
+        session = SessionFile(self.filename)
+        self.assertEqual(
+            [chunk[0] for chunk in session.chunks], [300, 300, 300, 100])
+        self.assertEqual(
+            [dp.get_csv_data() for dp in session.get_datapoints()],
+            [dp.get_csv_data() for dp in self.datapoints])
+
+    def test_get_columns(self):
+        with SessionFile(self.filename, RealtimeDataPoint,
+                         chunk_size=100) as session:
+            for dp in self.datapoints:
+                session.write(dp)
+        starttime = self.datapoints[250].time
+        endtime = self.datapoints[420].time
+        self.assertEqual(session.find_chunks(starttime, endtime), [2, 3, 4])
+        with patch.object(session, 'read_chunk',
+                          wraps=session.read_chunk) as read_chunk:
+            columns = session.get_columns(starttime, endtime, ['spO2'])
+        self.assertEqual(read_chunk.call_count, 3)
+        self.assertEqual(sorted(columns), ['spO2', 'time'])
+        self.assertEqual(
+            columns['spO2'].tolist(),
+            [dp.spO2 for dp in self.datapoints[250:420]])
+        self.assertEqual(
+            columns['time'][0], np.datetime64(starttime, 'us'))
+        columns = session.get_columns(endtime, starttime)
+        self.assertEqual(len(columns['time']), 0)
+        self.assertEqual(len(columns), len(RealtimeDataPoint.dtype) + 1)
+
+    def test_invalid(self):
+        with open(self.filename, 'wb') as sessionfile:
+            sessionfile.write(b'CMS50D+\x01' + bytes(100))
+        self.assertRaises(ValueError, SessionFile, self.filename)
+        self.assertRaises(
+            ValueError, SessionFile, self.filename, compression='gzip')
+
+
+class RecordingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        start = datetime.datetime(2020, 1, 1)
+        self.datapoints = [
+            RealtimeDataPoint(
+                0x01, test_package(7),
+                start + datetime.timedelta(seconds=idx / 60))
+            for idx in range(0, 1000)]
+        self.starttime = self.datapoints[250].time
+        self.endtime = self.datapoints[420].time
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_csv(self, filename, datapoints, mode='w'):
+        with open(filename, mode) as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            if mode == 'w':
+                writer.writerow(RealtimeDataPoint.get_csv_header())
+            for dp in datapoints:
+                writer.writerow(dp.get_csv_data())
+
+    def assertSlice(self, recording, datapoints):
+        columns = recording.slice(
+            self.starttime, self.endtime, columns=['spO2'])
+        self.assertEqual(sorted(columns), ['spO2', 'time'])
+        self.assertEqual(
+            columns['spO2'].tolist(),
+            [dp.spO2 for dp in datapoints[250:420]])
+        self.assertEqual(
+            columns['time'][0].item(), datapoints[250].time)
+
+    def test_csv(self):
+        filename = os.path.join(self.directory.name, 'data.csv')
+        self.write_csv(filename, self.datapoints[:900])
+        recording = Recording(filename)
+        self.assertTrue(os.path.exists(filename + '.idx'))
+        self.assertEqual(len(recording), 900)
+        self.assertSlice(recording, self.datapoints)
+        columns = recording.slice(self.endtime, self.starttime)
+        self.assertEqual(len(columns['time']), 0)
+
+        # reads the covering blocks only
+        csvfile = CsvFile(filename, index_interval=100)
+        with patch('cms50dplus.parse_csv_rows',
+                   wraps=cms50dplus.parse_csv_rows) as parse_csv_rows:
+            csvfile.get_columns(self.starttime, self.endtime)
+        self.assertEqual(len(parse_csv_rows.call_args[0][1]), 300)
+
+        # the index is extended as the file grows
+        self.write_csv(filename, self.datapoints[900:], mode='a')
+        csvfile = CsvFile(filename, index_interval=100)
+        self.assertEqual(len(csvfile), 1000)
+        self.assertEqual(len(csvfile.index), 10)
+        columns = csvfile.get_columns(self.datapoints[950].time)
+        self.assertEqual(len(columns['time']), 50)
+
+        # a rewritten file is indexed again
+        for dp in self.datapoints:
+            dp.time += datetime.timedelta(days=1)
+        self.write_csv(filename, self.datapoints)
+        csvfile = CsvFile(filename, index_interval=100)
+        self.assertEqual(
+            csvfile.index['time'][0],
+            np.datetime64(self.datapoints[0].time, 'us').astype(np.int64))
+
+        # a corrupt index is rebuilt
+        with open(filename + '.idx', 'r+b') as indexfile:
+            indexfile.truncate(CsvFile.index_header.size + 5)
+        self.assertEqual(len(CsvFile(filename, index_interval=100)), 1000)
+
+    def test_csv_index_unwritable(self):
+        filename = os.path.join(self.directory.name, 'data.csv')
+        self.write_csv(filename, self.datapoints)
+        os.mkdir(filename + '.idx')  # neither readable nor writable
+        recording = Recording(filename)
+        self.assertEqual(len(recording), 1000)
+        self.assertSlice(recording, self.datapoints)
+
+    def test_session(self):
+        filename = os.path.join(self.directory.name, 'data.cms50')
+        with SessionFile(filename, RealtimeDataPoint, chunk_size=100) \
+                as session:
+            for dp in self.datapoints:
+                session.write(dp)
+        recording = Recording(filename)
+        self.assertEqual(recording.DataPointClass, RealtimeDataPoint)
+        self.assertSlice(recording, self.datapoints)
+
+    def test_raw(self):
+        filename = os.path.join(self.directory.name, 'data.raw')
+        with RawCapture(filename) as capture:
+            for dp in self.datapoints:
+                capture.write(
+                    CMS50Dplus.encode_package(0x01, dp.get_package()),
+                    dp.time)
+        self.assertSlice(Recording(filename), self.datapoints)
+
+
+class SegmentedWriterTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'realtime.csv')
+        start = datetime.datetime(2020, 1, 1, 0, 0, 58)
+        self.datapoints = [
+            RealtimeDataPoint(
+                0x01, test_package(7),
+                start + datetime.timedelta(seconds=idx / 60))
+            for idx in range(0, 1000)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load_manifest(self):
+        with open(os.path.join(
+                self.directory.name, 'realtime.manifest.json')) as manifest:
+            return json.load(manifest)['segments']
+
+    def test_segment_seconds(self):
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_seconds=5) as writer:
+            for dp in self.datapoints:
+                writer.write(dp)
+        segments = self.load_manifest()
+        self.assertEqual(
+            [segment['filename'] for segment in segments], [
+                'realtime-20200101-000058.csv',
+                'realtime-20200101-000100.csv',
+                'realtime-20200101-000105.csv',
+                'realtime-20200101-000110.csv'])
+        self.assertEqual(
+            [segment['rows'] for segment in segments], [120, 300, 300, 280])
+        self.assertEqual(segments[1]['starttime'], '2020-01-01 00:01:00')
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            sorted([segment['filename'] for segment in segments]
+                   + ['realtime.manifest.json']))
+        columns = Recording(os.path.join(
+            self.directory.name, segments[1]['filename'])).slice()
+        self.assertEqual(
+            columns['spO2'].tolist(),
+            [dp.spO2 for dp in self.datapoints[120:420]])
+
+    def test_segment_size(self):
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_size=10000) as writer:
+            for dp in self.datapoints:
+                writer.write(dp)
+                time.sleep(0.0001)
+        segments = self.load_manifest()
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(sum(segment['rows'] for segment in segments), 1000)
+
+    def test_recover(self):
+        filename = os.path.join(
+            self.directory.name, '.realtime-20200101-000058.csv')
+        with open(filename, 'w') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(RealtimeDataPoint.get_csv_header())
+            for dp in self.datapoints[:10]:
+                writer.writerow(dp.get_csv_data())
+            csvfile.write('"2020-01-01 00:0')  # torn row
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_seconds=5) as writer:
+            writer.write(self.datapoints[10])
+        segments = self.load_manifest()
+        self.assertEqual(
+            [segment['filename'] for segment in segments], [
+                'realtime-20200101-000058.csv',
+                'realtime-20200101-000058-1.csv'])
+        self.assertEqual(segments[0]['rows'], 10)
+        self.assertEqual(
+            segments[0]['endtime'], str(self.datapoints[9].time))
+
+        # renamed, but not added to the manifest
+        os.remove(os.path.join(
+            self.directory.name, 'realtime.manifest.json'))
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_seconds=5) as writer:
+            pass
+        self.assertEqual(
+            [segment['filename'] for segment in self.load_manifest()], [
+                'realtime-20200101-000058-1.csv',
+                'realtime-20200101-000058.csv'])
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_seconds=5) as writer:
+            pass
+        self.assertEqual(len(self.load_manifest()), 2)
+
+    def test_recover_names(self):
+        # only names of segments are recovered
+        for filename in ['realtime-merged.csv', 'realtime-2.csv',
+                         '.realtime-20200101-000058.csv.tmp']:
+            with open(os.path.join(self.directory.name, filename), 'w') \
+                    as csvfile:
+                writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+                writer.writerow(RealtimeDataPoint.get_csv_header())
+                writer.writerow(self.datapoints[0].get_csv_data())
+
+        # unreadable segments are reported and left in place
+        filename = os.path.join(
+            self.directory.name, '.realtime-20200101-000030.csv')
+        with open(filename, 'w') as csvfile:
+            csvfile.write('garbage\n')
+        with SegmentedWriter(self.filename, RealtimeDataPoint,
+                             segment_seconds=5) as writer:
+            writer.write(self.datapoints[0])
+        self.assertEqual(
+            [segment['filename'] for segment in self.load_manifest()],
+            ['realtime-20200101-000058.csv'])
+        self.assertEqual(
+            [filename for filename, _ in writer.stats['errors']],
+            ['.realtime-20200101-000030.csv'])
+        self.assertTrue(os.path.exists(filename))
+        self.assertEqual(len(os.listdir(self.directory.name)), 6)
+
+    def test_recover_session(self):
+        # the readable chunks of a torn session file are kept
+        filename = os.path.join(
+            self.directory.name, '.realtime-20200101-000058.cms50')
+        with SessionFile(filename, RealtimeDataPoint, chunk_size=5) \
+                as session:
+            for dp in self.datapoints[:12]:
+                session.write(dp)
+        with open(filename, 'r+b') as sessionfile:
+            sessionfile.truncate(os.path.getsize(filename) - 1)
+        with SegmentedWriter(
+                os.path.join(self.directory.name, 'realtime.cms50'),
+                RealtimeDataPoint, segment_seconds=5):
+            pass
+        segments = self.load_manifest()
+        self.assertEqual(
+            [segment['filename'] for segment in segments],
+            ['realtime-20200101-000058.cms50'])
+        self.assertEqual(segments[0]['rows'], 10)
+
+    def test_local_time(self):
+        # segments end on the local hour in a half hour time zone
+        timezone = os.environ.get('TZ')
+        os.environ['TZ'] = 'IST-5:30'
+        time.tzset()
+        try:
+            with SegmentedWriter(self.filename, RealtimeDataPoint,
+                                 segment_seconds=3600) as writer:
+                for minutes in [0, 20, 40, 60]:
+                    writer.write(RealtimeDataPoint(
+                        0x01, test_package(7), datetime.datetime(
+                            2020, 1, 1, 10, 20) + datetime.timedelta(
+                                minutes=minutes)))
+        finally:
+            if timezone is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = timezone
+            time.tzset()
+        self.assertEqual(
+            [segment['rows'] for segment in self.load_manifest()], [2, 2])
+
+
+class MergeRecordingsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        start = datetime.datetime(2020, 1, 1)
+        self.datapoints = [
+            RealtimeDataPoint(
+                0x01, test_package(7),
+                start + datetime.timedelta(seconds=idx / 60))
+            for idx in range(0, 1000)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def write_csv(self, filename, datapoints):
+        with open(self.get_path(filename), 'w') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(RealtimeDataPoint.get_csv_header())
+            for dp in datapoints:
+                writer.writerow(dp.get_csv_data())
+
+    def test_merge(self):
+        self.write_csv('a.csv', self.datapoints[:600:2])
+        self.write_csv('b.csv', self.datapoints[1:600:2])
+        with SessionFile(self.get_path('c.cms50'), RealtimeDataPoint) \
+                as session:
+            for dp in self.datapoints[400:]:
+                session.write(dp)
+        stats = merge_recordings(
+            [self.get_path(name) for name in ['a.csv', 'b.csv', 'c.cms50']],
+            self.get_path('merged.csv'), tolerance=0)
+        self.assertEqual(stats, {'rows': 1000, 'duplicates': 200, 'gaps': 0})
+        columns = Recording(self.get_path('merged.csv')).slice()
+        self.assertEqual(
+            columns['pulse_waveform'].tolist(),
+            [dp.pulse_waveform for dp in self.datapoints])
+
+    def test_overlap(self):
+        # the same signal recorded twice with offset timestamps
+        offset = datetime.timedelta(milliseconds=7)
+        self.write_csv('a.csv', self.datapoints[:600])
+        self.write_csv('b.csv', [
+            RealtimeDataPoint(0x01, dp.get_package(), dp.time + offset)
+            for dp in self.datapoints[300:]])
+        stats = merge_recordings(
+            [self.get_path('a.csv'), self.get_path('b.csv')],
+            self.get_path('merged.cms50'))
+        # the first row of b after a ends is still within the tolerance
+        self.assertEqual(stats, {'rows': 999, 'duplicates': 301, 'gaps': 0})
+        times = Recording(self.get_path('merged.cms50')).slice()['time']
+        self.assertEqual(times[599].item(), self.datapoints[599].time)
+        self.assertEqual(times[600].item(), self.datapoints[601].time + offset)
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ['a.csv', 'b.csv', 'merged.cms50'])
+
+    def test_gaps(self):
+        self.write_csv('a.csv', self.datapoints[:300])
+        self.write_csv('b.csv', self.datapoints[700:])
+        stats = merge_recordings(
+            [self.get_path('b.csv'), self.get_path('a.csv')],
+            self.get_path('merged.cms50'), gap_seconds=1)
+        self.assertEqual(stats, {'rows': 600, 'duplicates': 0, 'gaps': 1})
+        datapoints = list(
+            SessionFile(self.get_path('merged.cms50')).get_datapoints())
+        self.assertEqual(len(datapoints), 601)
+        gap = datapoints[300]
+        self.assertEqual(
+            gap.time,
+            self.datapoints[299].time
+            + (self.datapoints[700].time - self.datapoints[299].time) / 2)
+        self.assertEqual((gap.spO2, gap.pulse_rate), (0, 0))
+        self.assertEqual((gap.spO2_invalid, gap.pulse_rate_invalid), (1, 1))
+
+    def test_datatype_mismatch(self):
+        self.write_csv('a.csv', self.datapoints[:10])
+        with open(self.get_path('b.csv'), 'w') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(StorageDataPoint.get_csv_header())
+            writer.writerow(
+                StorageDataPoint(0x0f, test_package(2)).get_csv_data())
+        self.assertRaises(
+            ValueError, merge_recordings,
+            [self.get_path('a.csv'), self.get_path('b.csv')],
+            self.get_path('merged.csv'))
+
+
+class ConvertDirectoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        os.mkdir(self.get_path('night'))
+        self.realtime = [
+            RealtimeDataPoint(0x01, test_package(7)) for idx in range(0, 100)]
+        self.storage = [
+            StorageDataPoint(0x09, test_package(4)) for idx in range(0, 50)]
+        self.write_csv('realtime.csv', self.realtime)
+        self.write_csv(os.path.join('night', 'storage.csv'), self.storage)
+        with open(self.get_path('invalid.csv'), 'w') as csvfile:
+            csvfile.write('no,recording\n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_path(self, filename):
+        return os.path.join(self.directory.name, filename)
+
+    def write_csv(self, filename, datapoints, reverse=False):
+        step = -1 if reverse else 1
+        with open(self.get_path(filename), 'w') as csvfile:
+            writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+            writer.writerow(datapoints[0].get_csv_header()[::step])
+            for dp in datapoints:
+                writer.writerow(dp.get_csv_data()[::step])
+
+    def test_convert(self):
+        stats = convert_directory(self.directory.name, jobs=2)
+        self.assertEqual(
+            (stats['converted'], stats['failed'], stats['skipped']),
+            (2, 1, 0))
+        self.assertEqual(stats['errors'][0][0], 'invalid.csv')
+        for filename, datapoints in [
+                ('realtime.cms50', self.realtime),
+                (os.path.join('night', 'storage.cms50'), self.storage)]:
+            session = SessionFile(self.get_path(filename))
+            for dp, other in zip(datapoints, session.get_datapoints()):
+                self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+        self.assertFalse(
+            [name for name in os.listdir(self.get_path('night'))
+             if name.startswith('.')])
+
+        # resume
+        os.remove(self.get_path('invalid.csv'))
+        with open(self.get_path('.cms50dplus7-convert.journal'), 'a') \
+                as journal:
+            journal.write('{"source": "realt')  # torn line
+        stats = convert_directory(self.directory.name)
+        self.assertEqual(
+            (stats['converted'], stats['failed'], stats['skipped']),
+            (0, 0, 2))
+
+        # changed and foreign files
+        self.write_csv('realtime.csv', self.realtime[:10], reverse=True)
+        stats = convert_directory(self.directory.name)
+        self.assertEqual(
+            (stats['converted'], stats['failed'], stats['skipped']),
+            (1, 0, 1))
+        self.assertEqual(len(SessionFile(self.get_path('realtime.cms50'))), 10)
+
+
+class AsyncCMS50DplusTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.master, self.slave = os.openpty()
+        self.oxi = AsyncCMS50Dplus(os.ttyname(self.slave), timeout=0.2)
+
+    def tearDown(self):
+        self.oxi.disconnect()
+        os.close(self.slave)
+        os.close(self.master)
+
+    def send(self, packets_list, delay=0.05):
+        # write after the client started reading and reset its buffers
+        data = bytes([byte for packets in packets_list for byte in packets])
+        asyncio.get_running_loop().call_later(
+            delay, os.write, self.master, data)
+
+    def received_commands(self):
+        data = b''
+        while select.select([self.master], [], [], 0.05)[0]:
+            data += os.read(self.master, 1024)
+        return [data[idx + 2] & 0x7f | 0x80 for idx in range(0, len(data), 9)]
+
+    async def test_get_realtime_data(self):
+        package = test_package(7)
+        self.send([CMS50Dplus.encode_package(0x01, package)] * 10 + [
+            CMS50Dplus.encode_package(0x0d, [0x00])])
+        datapoints = [dp async for dp in self.oxi.get_realtime_data()]
+        self.assertEqual(len(datapoints), 10)
+        for datapoint in datapoints:
+            self.assertIsInstance(datapoint, RealtimeDataPoint)
+            self.assertEqual(datapoint.get_package(), package)
+        self.assertEqual(self.received_commands(), [0xa1, 0xa2])
+
+    async def test_get_realtime_data_keepalive(self):
+        datapoints = self.oxi.get_realtime_data()
+        self.send([CMS50Dplus.encode_package(0x01, test_package(7))] * 2)
+        await datapoints.__anext__()
+
+        # drive the scheduled keepalives with a mocked monotonic clock
+        deadline = self.oxi.keepalive_deadline
+        for now in [deadline - 1, deadline, deadline + 1]:
+            self.oxi.stop_keepalive()
+            with patch('time.monotonic', return_value=now):
+                self.oxi.on_keepalive()
+            self.assertIsNotNone(self.oxi.keepalive_handle)
+        self.assertEqual(self.oxi.keepalive_stats['sent'], 1)
+        self.assertEqual(
+            self.oxi.keepalive_deadline,
+            deadline + self.oxi.keepalive_seconds)
+
+        await datapoints.__anext__()
+        await datapoints.aclose()
+        self.assertIsNone(self.oxi.keepalive_handle)
+        self.assertEqual(self.received_commands(), [0xa1, 0xaf, 0xa2])
+
+    async def test_get_storage_data(self):
+        package = [0x60, 0x50] * 3
+        self.send([CMS50Dplus.encode_package(0x0f, package)] * 10)
+        starttime = datetime.datetime(2020, 1, 1)
+        datapoints = [
+            dp async for dp in self.oxi.get_storage_data(starttime)]
+        self.assertEqual(len(datapoints), 30)
+        for idx, datapoint in enumerate(datapoints):
+            self.assertIsInstance(datapoint, StorageDataPoint)
+            self.assertEqual(
+                datapoint.time,
+                starttime + idx * self.oxi.storage_time_interval)
+        self.assertEqual(self.received_commands(), [0xa6, 0xa7])
+
+
+class CMS50DplusHubTests(unittest.TestCase):
+
+    def setUp(self):
+        self.hub = CMS50DplusHub(timeout=0.05)
+        self.ptys = {}
+        self.datapoints = []
+        for device_id in ['a', 'b', 'c']:
+            master, slave = os.openpty()
+            self.ptys[device_id] = (master, slave)
+            self.hub.add_device(
+                device_id, CMS50Dplus(os.ttyname(slave)),
+                lambda *args: self.datapoints.append(args))
+
+    def tearDown(self):
+        for master, slave in self.ptys.values():
+            os.close(slave)
+            os.close(master)
+
+    def send(self, device_id, packets_list):
+        os.write(self.ptys[device_id][0], bytes(
+            [byte for packets in packets_list for byte in packets]))
+
+    def test_dispatch(self):
+        self.hub.start()
+        packages = {}
+        for device_id in self.ptys:
+            packages[device_id] = test_package(7)
+            self.send(device_id, [
+                CMS50Dplus.encode_package(0x01, packages[device_id])] * 10)
+        for run in range(0, 10):
+            self.hub.poll()
+        self.assertEqual(len(self.datapoints), 30)
+        for device_id, datapoint in self.datapoints:
+            self.assertIsInstance(datapoint, RealtimeDataPoint)
+            self.assertEqual(datapoint.get_package(), packages[device_id])
+        for device_id, rate in self.hub.get_frame_rates().items():
+            self.assertEqual(self.hub.stats[device_id]['frames'], 10)
+            self.assertGreater(rate, 0)
+        for device_id, rate in self.hub.get_frame_rates().items():
+            self.assertEqual(rate, 0)
+
+    def test_disconnect_notice(self):
+        self.hub.start()
+        self.send('b', [
+            CMS50Dplus.encode_package(0x01, test_package(7)),
+            CMS50Dplus.encode_package(0x0d, [0x00]),
+            CMS50Dplus.encode_package(0x01, test_package(7))])
+        for run in range(0, 5):
+            self.hub.poll()
+        self.assertEqual(len(self.datapoints), 1)
+        self.assertEqual(sorted(self.hub.devices), ['a', 'c'])
+        self.assertEqual(sorted(self.hub.get_frame_rates()), ['a', 'c'])
+
+    def test_errors(self):
+        self.hub.start()
+        packets = CMS50Dplus.encode_package(0x01, test_package(7))
+        self.send('c', [
+            [0x01, 0x80], packets, packets,
+            CMS50Dplus.encode_package(0x02, test_package(7)), packets])
+        for run in range(0, 5):
+            self.hub.poll()
+        self.assertEqual(self.hub.stats['c']['errors'], 2)
+        self.assertEqual(len(self.datapoints), 3)
+
+
+class CMS50DplusEmulatorTests(unittest.TestCase):
+
+    def test_realtime(self):
+        packages = [test_package(7) for idx in range(0, 100)]
+        realtime = [RealtimeDataPoint(0x01, package) for package in packages]
+        with CMS50DplusEmulator(realtime=realtime, rate=0) as emulator:
+            oxi = CMS50Dplus(emulator.port, timeout=0.2)
+            datapoints = list(oxi.get_realtime_data())
+            oxi.disconnect()
+        self.assertEqual(
+            [datapoint.get_package() for datapoint in datapoints], packages)
+        self.assertEqual(emulator.stats['frames'], 100)
+        self.assertEqual(emulator.stats['commands'], 2)
+
+    @patch('time.monotonic')
+    def test_realtime_rate(self, monotonic):
+        emulator = CMS50DplusEmulator(rate=200)
+        try:
+            monotonic.return_value = 100
+            emulator.handle_command(0xa1, [])
+            for now, frames in [(100, 0), (100.125, 25), (100.125, 25),
+                                (100.25, 50), (101, 200)]:
+                monotonic.return_value = now
+                emulator.fill_output()
+                self.assertEqual(emulator.stats['frames'], frames)
+            self.assertEqual(len(emulator.output), 200 * 9)
+            self.assertEqual(emulator.get_timeout(), 0.05)
+            emulator.output.clear()
+            self.assertAlmostEqual(emulator.get_timeout(), 0.005)
+        finally:
+            emulator.stop()
+
+    def test_storage(self):
+        packages = [[0x60, idx + 1] for idx in range(0, 31)]
+        storage = [StorageDataPoint(0x0f, package) for package in packages]
+        with CMS50DplusEmulator(storage=storage, rate=0) as emulator:
+            oxi = CMS50Dplus(emulator.port, timeout=0.2)
+            datapoints = list(oxi.get_storage_data())
+            oxi.disconnect()
+        self.assertEqual(
+            [datapoint.get_package() for datapoint in datapoints], packages)
+        self.assertEqual(emulator.stats['frames'], 11)
+
+    def test_storage_end_of_stream(self):
+        storage = [StorageDataPoint(0x0f, [0x60, 0x50])] * 3000
+        with CMS50DplusEmulator(storage=storage, rate=0) as emulator:
+            oxi = CMS50Dplus(emulator.port, timeout=1)
+            datapoints = oxi.get_storage_data()
+            next(datapoints)
+            start = time.monotonic()
+            self.assertEqual(len(list(datapoints)), 2999)
+            seconds = time.monotonic() - start
+            oxi.disconnect()
+        self.assertLess(seconds, 0.9)
+
+    def test_storage_cache(self):
+        storage = [
+            StorageDataPoint(0x0f, [0x60, idx % 100 + 1])
+            for idx in range(0, 300)]
+        with CMS50DplusEmulator(storage=storage, rate=0) as emulator:
+            oxi = CMS50Dplus(emulator.port, timeout=0.2)
+            with tempfile.TemporaryDirectory() as directory:
+                cache = StorageCache(directory)
+                datapoints = list(oxi.get_storage_data(cache=cache))
+                self.assertEqual(len(datapoints), 300)
+                self.assertTrue(os.listdir(directory)[0].endswith('.raw'))
+
+                # served from the cache, though the device now sends less
+                emulator.storage = storage[:30]
+                cached = list(oxi.get_storage_data(cache=cache))
+                self.assertEqual(len(os.listdir(directory)), 1)
+            oxi.disconnect()
+        self.assertEqual(
+            [datapoint.get_package() for datapoint in cached],
+            [datapoint.get_package() for datapoint in datapoints])
+
 
 class RealtimeDataTests(unittest.TestCase):
 
@@ -613,6 +2048,138 @@ class RealtimeDataTests(unittest.TestCase):
             self.assertEqual(dp.get_package(), package)
             self.assertEqual(dp.__repr__(), eval(dp.__repr__()).__repr__())
 
+    def test_decode_packages(self):
+        package_type = 0x01
+        package_list = [test_package(7) for run in range(0, 100)]
+        records = RealtimeDataPoint.decode_packages(
+            np.full(100, package_type), np.array(package_list))
+        names = RealtimeDataPoint.get_attribute_names()
+        names.remove('time')
+        names.remove('datatype')
+        self.assertEqual(sorted(records.dtype.names), sorted(names))
+        for record, package in zip(records, package_list):
+            dp = RealtimeDataPoint(package_type, package)
+            for name in records.dtype.names:
+                self.assertEqual(record[name], getattr(dp, name))
+
+    def test_decode_packages_package_length(self):
+        self.assertRaisesRegex(
+            ValueError, 'package length',
+            RealtimeDataPoint.decode_packages,
+            np.full(10, 0x01), np.zeros((10, 6), dtype=np.uint8))
+
+    def test_slots(self):
+        dp = RealtimeDataPoint(0x01, test_package(7))
+        self.assertFalse(hasattr(dp, '__dict__'))
+        self.assertRaises(AttributeError, setattr, dp, 'spo2', 98)
+
+    def test_csv_data(self):
+        dp = RealtimeDataPoint(0x01, test_package(7))
+        other = RealtimeDataPoint(0x01, [0] * 7)
+        data = dp.get_dict_data()
+        data['Time'] = str(dp.time)
+        other.set_csv_data(data)
+        self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+
+    def test_bit_tables(self):
+        for byte in range(0, 256):
+            dp = RealtimeDataPoint(0x01, [byte, byte, byte, 0, 0, 0, 0])
+            for idx, fields in enumerate(RealtimeDataPoint.bit_fields):
+                for name, mask, shift in fields:
+                    self.assertEqual(
+                        getattr(dp, name), (byte & mask) >> shift)
+
+    def test_lazy(self):
+        for run in range(0, 100):
+            package = test_package(7)
+            time = datetime.datetime.now()
+            dp = RealtimeDataPoint(0x01, package, time)
+            lazy = LazyRealtimeDataPoint(0x01, package, time)
+            self.assertEqual(lazy.get_csv_data(), dp.get_csv_data())
+            self.assertEqual(lazy.get_package(), package)
+            self.assertIsNot(lazy.get_package(), lazy.get_package())
+
+        # changed attributes
+        lazy.spO2 = 0x7f
+        self.assertIsNone(lazy.package)
+        self.assertEqual(lazy.spO2, 0x7f)
+        self.assertEqual(lazy.pulse_rate, dp.pulse_rate)
+        self.assertEqual(lazy.get_package()[4], 0x7f)
+
+    def test_lazy_columns(self):
+        datapoints = [
+            LazyRealtimeDataPoint(0x01, test_package(7))
+            for idx in range(0, 100)]
+        columns = LazyRealtimeDataPoint.get_columns(datapoints)
+        datapoints[0].pi = 0
+        other = LazyRealtimeDataPoint.get_columns(datapoints)
+        for name in columns:
+            self.assertEqual(
+                columns[name][1:].tolist(), other[name][1:].tolist())
+        array = DataPointArray(LazyRealtimeDataPoint)
+        array.append(columns)
+        self.assertEqual(
+            array[-1].get_csv_data(), datapoints[-1].get_csv_data())
+
+    def test_load_csv_data(self):
+        datapoints = [
+            RealtimeDataPoint(0x01, test_package(7)) for idx in range(0, 100)]
+        datapoints[0].time = datapoints[0].time.replace(microsecond=0)
+        header = RealtimeDataPoint.get_csv_header()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'data.csv')
+            with open(filename, 'w') as csvfile:
+                writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+                writer.writerow(header)
+                for dp in datapoints:
+                    writer.writerow(dp.get_csv_data())
+            with patch('cms50dplus.read_csv_data') as read:
+                array = load_csv_data(filename)
+            read.assert_not_called()
+            self.assertEqual(len(array), 100)
+            for dp, other in zip(datapoints, array):
+                self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+
+            # foreign column order
+            with open(filename, 'w') as csvfile:
+                writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+                writer.writerow(header[::-1])
+                for dp in datapoints:
+                    writer.writerow(dp.get_csv_data()[::-1])
+            array = load_csv_data(filename)
+            for dp, other in zip(read_csv_data(filename), array):
+                self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+
+    def test_datapoint_array(self):
+        datapoints = [
+            RealtimeDataPoint(0x01, test_package(7)) for idx in range(0, 100)]
+        array = DataPointArray(RealtimeDataPoint, capacity=16)
+        array.extend(datapoints, batch_size=30)
+        self.assertEqual(len(array), 100)
+        self.assertEqual(len(array.columns['time']), 128)
+        for dp, other in zip(datapoints, array):
+            self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+        self.assertEqual(array[-1].get_package(), datapoints[-1].get_package())
+        self.assertEqual(len(array[10:20]), 10)
+        self.assertRaises(IndexError, array.__getitem__, 100)
+        self.assertEqual(
+            array.get_column('spO2').tolist(), [dp.spO2 for dp in datapoints])
+
+        # batch
+        columns = RealtimeDataPoint.get_columns(datapoints[:50])
+        array.append(columns)
+        self.assertEqual(len(array), 150)
+        self.assertEqual(len(array.columns['time']), 256)
+        self.assertEqual(
+            array.get_column('pulse_rate', 150, 2)[50:].tolist(),
+            columns['pulse_rate'][::2].tolist())
+        self.assertTrue(np.shares_memory(
+            array.get_column('time', 50), array.columns['time']))
+
+        # bytes per datapoint
+        size = sum(column.itemsize for column in array.columns.values())
+        self.assertLess(size, 32)
+
 
 class StorageDataTests(unittest.TestCase):
 
@@ -796,6 +2363,65 @@ class StorageDataTests(unittest.TestCase):
             self.assertEqual(dp.get_package(), package)
             self.assertEqual(dp.__repr__(), eval(dp.__repr__()).__repr__())
 
+    def test_decode_packages(self):
+        # without pi support, empty datapoints skipped
+        package_type = 0x0f
+        package_list = [test_package(6) for run in range(0, 100)]
+        package_list[0][2:4] = [0x00, 0x10]
+        records = StorageDataPoint.decode_packages(
+            np.full(100, package_type), np.array(package_list))
+        datapoints = [
+            StorageDataPoint(package_type, package[idx:idx + 2])
+            for package in package_list for idx in [0, 2, 4]
+            if package[idx] and package[idx + 1]]
+        self.assertEqual(len(records), len(datapoints))
+        for record, dp in zip(records, datapoints):
+            self.assertEqual(record['spO2'], dp.spO2)
+            self.assertEqual(record['pulse_rate'], dp.pulse_rate)
+            self.assertEqual(record['pi'], -1)
+            self.assertEqual(record['pi_invalid'], -1)
+
+        # with pi support
+        package_type = 0x09
+        package_list = [test_package(4) for run in range(0, 100)]
+        records = StorageDataPoint.decode_packages(
+            np.full(100, package_type), np.array(package_list))
+        names = StorageDataPoint.get_attribute_names()
+        names.remove('time')
+        names.remove('datatype')
+        self.assertEqual(sorted(records.dtype.names), sorted(names))
+        for record, package in zip(records, package_list):
+            dp = StorageDataPoint(package_type, package)
+            for name in records.dtype.names:
+                self.assertEqual(record[name], getattr(dp, name))
+
+    def test_datapoint_array(self):
+        datapoints = [
+            StorageDataPoint(0x0f, test_package(2)),
+            StorageDataPoint(0x09, test_package(4))]
+        array = DataPointArray(StorageDataPoint)
+        array.append(StorageDataPoint.get_columns(datapoints))
+        for dp, other in zip(datapoints, array):
+            self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+        self.assertEqual(array[0].pi, "-")
+        self.assertEqual(array.get_column('pi')[0], -1)
+
+    def test_load_csv_data(self):
+        datapoints = [
+            StorageDataPoint(0x0f, test_package(2)),
+            StorageDataPoint(0x09, test_package(4))]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'data.csv')
+            with open(filename, 'w') as csvfile:
+                writer = csv.writer(csvfile, quoting=csv.QUOTE_NONNUMERIC)
+                writer.writerow(StorageDataPoint.get_csv_header())
+                for dp in datapoints:
+                    writer.writerow(dp.get_csv_data())
+            array = load_csv_data(filename)
+        self.assertEqual(array.DataPointClass, StorageDataPoint)
+        for dp, other in zip(datapoints, array):
+            self.assertEqual(other.get_csv_data(), dp.get_csv_data())
+
 
 if __name__ == '__main__':
     unittest.main()